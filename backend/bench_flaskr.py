@@ -0,0 +1,244 @@
+"""
+Endpoint benchmarks for the trivia API.
+
+Seeds a database with a synthetic catalog of each requested size, drives every
+route through app.test_client() and prints throughput and latency percentiles
+as JSON, so results can be saved per commit and compared:
+
+    python bench_flaskr.py --sizes 10000,100000 --output bench.json
+    python bench_flaskr.py --sizes 10000,100000 --compare bench.json
+
+By default each size gets its own SQLite file in the current directory. Pass
+--database with a PostgreSQL URI to benchmark against a local Postgres; the
+tables in that database are dropped and re-created for every size.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+from flaskr import create_app
+from flaskr.cli import create_schema
+from models import Question, Category, db
+
+CATEGORIES = ['Science', 'Art', 'Geography', 'History', 'Entertainment', 'Sports']
+SEED_BATCH_SIZE = 10000
+
+
+def make_vocabulary(rng, size=2000):
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    return [''.join(rng.choice(letters) for _ in range(rng.randint(3, 10))) for _ in range(size)]
+
+
+def seed(app, size, rng, vocabulary):
+    with app.app_context():
+        create_schema(drop=True)
+        db.session.execute(Category.__table__.insert(), [{'type': name} for name in CATEGORIES])
+        category_ids = [category.id for category in Category.query.all()]
+
+        for start in range(0, size, SEED_BATCH_SIZE):
+            db.session.execute(Question.__table__.insert(), [
+                {
+                    'question': ' '.join(rng.choices(vocabulary, k=rng.randint(5, 12))) + '?',
+                    'answer': ' '.join(rng.choices(vocabulary, k=rng.randint(1, 3))),
+                    'category': rng.choice(category_ids),
+                    'difficulty': rng.randint(1, 5)
+                }
+                for _ in range(min(SEED_BATCH_SIZE, size - start))
+            ])
+        db.session.commit()
+        return category_ids
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def summarize(latencies, errors, elapsed):
+    ordered = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3) if ordered else None,
+        'p50_ms': round(percentile(ordered, 0.50) * 1000, 3) if ordered else None,
+        'p95_ms': round(percentile(ordered, 0.95) * 1000, 3) if ordered else None,
+        'p99_ms': round(percentile(ordered, 0.99) * 1000, 3) if ordered else None,
+    }
+
+
+def run_scenario(request, count, warmup):
+    """Call `request()` `warmup` times untimed, then `count` times timed."""
+    for _ in range(warmup):
+        request()
+    latencies, errors = [], 0
+    started = time.perf_counter()
+    for _ in range(count):
+        before = time.perf_counter()
+        status = request()
+        latencies.append(time.perf_counter() - before)
+        if status >= 400:
+            errors += 1
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+def scenarios(client, size, category_ids, rng, vocabulary):
+    pages = max(1, size // 10)
+
+    def list_questions():
+        return client.get(f'/questions?page={rng.randint(1, pages)}').status_code
+
+    def list_questions_keyset():
+        return client.get(f'/questions?after_id={rng.randint(0, max(0, size - 10))}').status_code
+
+    def list_categories():
+        return client.get('/categories').status_code
+
+    def category_questions():
+        return client.get(f'/categories/{rng.choice(category_ids)}/questions').status_code
+
+    def search():
+        return client.post('/questions/search', json={'searchTerm': rng.choice(vocabulary)}).status_code
+
+    def quiz_turns():
+        # A whole game of five turns, each sending the growing previous_questions list
+        previous = []
+        category = {'id': rng.choice([0] + category_ids), 'type': ''}
+        status = 200
+        for _ in range(5):
+            res = client.post('/quizzes', json={'previous_questions': previous, 'quiz_category': category})
+            status = max(status, res.status_code)
+            if res.status_code != 200 or not res.get_json()['question']:
+                break
+            previous.append(res.get_json()['question']['id'])
+        return status
+
+    def quiz_token():
+        # The same game with a progress token instead of previous_questions
+        body = {'progress': True, 'quiz_category': {'id': rng.choice([0] + category_ids), 'type': ''}}
+        status = 200
+        for _ in range(5):
+            res = client.post('/quizzes', json=body)
+            status = max(status, res.status_code)
+            if res.status_code != 200 or not res.get_json()['question']:
+                break
+            body = {'progress_token': res.get_json()['progress_token']}
+        return status
+
+    def quiz_session():
+        res = client.post('/quizzes/sessions', json={'quiz_category': {'id': rng.choice(category_ids)}})
+        if res.status_code != 200:
+            return res.status_code
+        session_id = res.get_json()['session_id']
+        status = 200
+        for _ in range(5):
+            status = max(status, client.post(f'/quizzes/sessions/{session_id}/next').status_code)
+        return status
+
+    def create_delete():
+        res = client.post('/questions', json={
+            'question': ' '.join(rng.choices(vocabulary, k=8)) + '?',
+            'answer': rng.choice(vocabulary),
+            'category': rng.choice(category_ids),
+            'difficulty': rng.randint(1, 5)
+        })
+        if res.status_code != 200:
+            return res.status_code
+        return client.delete(f"/questions/{res.get_json()['created']}").status_code
+
+    return {
+        'list_questions': list_questions,
+        'list_questions_keyset': list_questions_keyset,
+        'list_categories': list_categories,
+        'category_questions': category_questions,
+        'search': search,
+        'quiz_turns': quiz_turns,
+        'quiz_token': quiz_token,
+        'quiz_session': quiz_session,
+        'create_delete': create_delete,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    """Print the p95 change of every scenario against a saved run."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)['results']
+    for size, size_results in results.items():
+        for name, stats in size_results.items():
+            before = baseline.get(size, {}).get(name)
+            if not before or not before.get('p95_ms') or stats['p95_ms'] is None:
+                continue
+            change = (stats['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100
+            print(f'{size:>8} {name:<24} p95 {before["p95_ms"]:>10.3f} -> {stats["p95_ms"]:>10.3f} ms '
+                  f'({change:+.1f}%)', file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10000,100000,1000000',
+                        help='comma separated catalog sizes to seed (default: %(default)s)')
+    parser.add_argument('--database', default=None,
+                        help='database URI; defaults to sqlite:///bench_<size>.db per size')
+    parser.add_argument('--requests', type=int, default=200, help='timed requests per scenario')
+    parser.add_argument('--warmup', type=int, default=10, help='untimed requests per scenario')
+    parser.add_argument('--scenarios', default=None, help='comma separated subset of scenarios to run')
+    parser.add_argument('--seed', type=int, default=1, help='random seed for data and requests')
+    parser.add_argument('--output', default=None, help='also write the JSON report to this file')
+    parser.add_argument('--compare', default=None, help='JSON report of an earlier run to compare p95 against')
+    args = parser.parse_args(argv)
+
+    results = {}
+    for size in [int(size) for size in args.sizes.split(',')]:
+        rng = random.Random(args.seed)
+        vocabulary = make_vocabulary(rng)
+        uri = args.database or f'sqlite:///{os.path.abspath(f"bench_{size}.db")}'
+        app = create_app({'SQLALCHEMY_DATABASE_URI': uri, 'TESTING': True, 'ADMISSION_ENABLED': False})
+
+        started = time.perf_counter()
+        category_ids = seed(app, size, rng, vocabulary)
+        print(f'seeded {size} questions in {time.perf_counter() - started:.1f}s', file=sys.stderr)
+
+        client = app.test_client()
+        results[str(size)] = {}
+        for name, request in scenarios(client, size, category_ids, rng, vocabulary).items():
+            if args.scenarios and name not in args.scenarios.split(','):
+                continue
+            results[str(size)][name] = run_scenario(request, args.requests, args.warmup)
+            print(f'{size:>8} {name:<24} {results[str(size)][name]}', file=sys.stderr)
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'database': args.database or 'sqlite',
+            'requests': args.requests,
+            'warmup': args.warmup,
+            'seed': args.seed,
+        },
+        'results': results
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
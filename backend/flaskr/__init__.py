@@ -1,11 +1,65 @@
-from flask import Flask, request, abort, jsonify
+from flask import Flask, Response, g, request, abort, jsonify, stream_with_context
 from flask_cors import CORS
+import csv
+import io
+import math
+import os
 import random
+import secrets
+import time
+from datetime import datetime, timezone
+from sqlalchemy import func, text
 from werkzeug.exceptions import HTTPException
 
-from models import setup_db, Question, Category, db
+from models import setup_db, pool_status, Question, db
+from . import admission
+from .batch import dispatch, parse_batch
+from .bulk import NDJSON_MIMETYPES, import_questions, iter_json_array, iter_ndjson, validate_question
+from .cache import CachedValue, CategoryRegistry, DataVersion, SearchResultCache, invalidate_question_caches, normalize_term
+from .cli import register_commands
+from .compression import Compressor, init_app as init_compression
+from . import metrics as request_metrics
+from .quiz import MemoryQuizSessionStore, QuizProgress
+from .search import create_search_engine
+from .serialization import create_json_provider
+from .suggest import SuggestionIndex
 
 QUESTIONS_PER_PAGE = 10
+QUESTION_COUNT_TTL = 30
+CATEGORY_CACHE_TTL = 300
+BULK_BATCH_SIZE = 1000
+BATCH_DELETE_LIMIT = 1000
+EXPORT_BATCH_SIZE = 1000
+EXPORT_COLUMNS = ['id', 'question', 'answer', 'category', 'difficulty']
+DATA_VERSION_TTL = 30
+# GET endpoints answered with 304 when the client's ETag is still current
+CONDITIONAL_ENDPOINTS = {'get_categories', 'get_questions', 'get_questions_by_category'}
+QUIZ_SESSION_LIMIT = 10000
+QUIZ_SESSION_TTL = 3600
+QUIZ_SESSION_MAX_IDS = 2000000
+QUIZ_DECK_SIZE = 1000
+SEARCH_CACHE_SIZE = 1024
+SEARCH_CACHE_TTL = 60
+SUGGEST_MAX_WORDS = 50000
+SUGGEST_LIMIT = 10
+SUGGEST_MAX_LIMIT = 20
+# Related data list endpoints can embed with ?include=
+INCLUDES = {'categories'}
+# Endpoints that only read, and so may read from a replica
+REPLICA_ENDPOINTS = {
+    'get_categories', 'get_questions', 'get_questions_by_category', 'search_questions',
+    'suggest_questions', 'export_questions', 'play_quiz', 'create_quiz_session', 'next_quiz_question'
+}
+COMPRESSION_MIN_SIZE = 500
+# Expensive endpoints guarded by admission control
+ADMISSION_ENDPOINTS = {'search_questions', 'play_quiz'}
+ADMISSION_RATE = 10
+ADMISSION_BURST = 20
+ADMISSION_CONCURRENCY = 16
+ADMISSION_QUEUE_SIZE = 64
+ADMISSION_QUEUE_TIMEOUT = 2
+COMPRESSION_CACHE_SIZE = 256
+BATCH_MAX_SIZE = 20
 
 def create_app(test_config=None):
     # create and configure the app
@@ -14,26 +68,166 @@ def create_app(test_config=None):
     if test_config is None:
         setup_db(app)
     else:
+        app.config.from_mapping(test_config)
         database_path = test_config.get('SQLALCHEMY_DATABASE_URI')
         setup_db(app, database_path=database_path)
 
+    app.json = create_json_provider(app)
+
+    app.extensions['question_count'] = CachedValue(
+        lambda: db.session.query(func.count(Question.id)).scalar(),
+        ttl=app.config.get('QUESTION_COUNT_TTL', QUESTION_COUNT_TTL)
+    )
+    app.extensions['category_registry'] = CategoryRegistry(
+        ttl=app.config.get('CATEGORY_CACHE_TTL', CATEGORY_CACHE_TTL)
+    )
+    categories = app.extensions['category_registry']
+    app.extensions['data_version'] = DataVersion(
+        ttl=app.config.get('DATA_VERSION_TTL', DATA_VERSION_TTL)
+    )
+    data_version = app.extensions['data_version']
+    app.extensions['quiz_sessions'] = app.config.get('QUIZ_SESSION_STORE') or MemoryQuizSessionStore(
+        max_sessions=app.config.get('QUIZ_SESSION_LIMIT', QUIZ_SESSION_LIMIT),
+        ttl=app.config.get('QUIZ_SESSION_TTL', QUIZ_SESSION_TTL),
+        max_ids=app.config.get('QUIZ_SESSION_MAX_IDS', QUIZ_SESSION_MAX_IDS)
+    )
+    quiz_sessions = app.extensions['quiz_sessions']
+    # Without a configured SECRET_KEY tokens only work in the process that issued them
+    app.extensions['quiz_progress'] = QuizProgress(
+        app.config.get('SECRET_KEY') or os.getenv('SECRET_KEY') or secrets.token_hex(32)
+    )
+    quiz_progress = app.extensions['quiz_progress']
+    app.extensions['search_engine'] = create_search_engine(app)
+    search_engine = app.extensions['search_engine']
+    app.extensions['search_results'] = SearchResultCache(
+        max_entries=app.config.get('SEARCH_CACHE_SIZE', SEARCH_CACHE_SIZE),
+        ttl=app.config.get('SEARCH_CACHE_TTL', SEARCH_CACHE_TTL)
+    )
+    search_results = app.extensions['search_results']
+    app.extensions['suggestions'] = SuggestionIndex(
+        max_words=app.config.get('SUGGEST_MAX_WORDS', SUGGEST_MAX_WORDS)
+    )
+    suggestions = app.extensions['suggestions']
+
+    def count_questions():
+        return app.extensions['question_count'].get()
+
+    def requested_fields():
+        # ?fields=id,question limits both the SELECT and the response
+        value = request.args.get('fields', None)
+        if value is None:
+            return None
+        fields = tuple(dict.fromkeys(field.strip() for field in value.split(',') if field.strip()))
+        if not fields or any(field not in Question.FIELDS for field in fields):
+            abort(400)
+        return fields
+
+    def requested_includes(default=()):
+        value = request.args.get('include', None)
+        if value is None:
+            return set(default)
+        includes = {name.strip() for name in value.split(',') if name.strip()}
+        if not includes <= INCLUDES:
+            abort(400)
+        return includes
+
+    def embed(response, includes):
+        if 'categories' in includes:
+            response['categories'] = categories.all()
+        return response
+
+    app.extensions['metrics'] = request_metrics.Metrics()
+    if app.config.get('METRICS_ENABLED', True):
+        request_metrics.init_app(app, app.extensions['metrics'])
+
+    # Registered before the other after_request hooks so it runs after them
+    # and compresses the final body, with its ETag already set
+    app.extensions['compression'] = Compressor(
+        min_size=app.config.get('COMPRESSION_MIN_SIZE', COMPRESSION_MIN_SIZE),
+        levels=app.config.get('COMPRESSION_LEVELS'),
+        cache_size=app.config.get('COMPRESSION_CACHE_SIZE', COMPRESSION_CACHE_SIZE),
+        encodings=app.config.get('COMPRESSION_ENCODINGS')
+    )
+    if app.config.get('COMPRESSION_ENABLED', True):
+        init_compression(app, app.extensions['compression'])
+
+    concurrency = app.config.get('ADMISSION_CONCURRENCY', ADMISSION_CONCURRENCY)
+    app.extensions['admission'] = admission.AdmissionController(
+        app.config.get('ADMISSION_BACKEND') or admission.MemoryRateLimitBackend(),
+        rate=app.config.get('ADMISSION_RATE', ADMISSION_RATE),
+        burst=app.config.get('ADMISSION_BURST', ADMISSION_BURST),
+        limiter=admission.ConcurrencyLimiter(
+            concurrency,
+            max_queue=app.config.get('ADMISSION_QUEUE_SIZE', ADMISSION_QUEUE_SIZE),
+            timeout=app.config.get('ADMISSION_QUEUE_TIMEOUT', ADMISSION_QUEUE_TIMEOUT)
+        ) if concurrency else None
+    )
+    if app.config.get('ADMISSION_ENABLED', True):
+        admission.init_app(
+            app,
+            app.extensions['admission'],
+            app.config.get('ADMISSION_ENDPOINTS', ADMISSION_ENDPOINTS),
+            app.extensions['metrics']
+        )
+
+    register_commands(app)
+
     # Set up CORS
     CORS(app, resources={r"/*": {"origins": "*"}})
 
+    if app.extensions['db_replicas']:
+        @app.before_request
+        def route_reads():
+            # db_primary is set by batches that have already written
+            g.db_use_replica = request.endpoint in REPLICA_ENDPOINTS and not g.get('db_primary', False)
+
+    def set_validators(response):
+        response.set_etag(g.etag, weak=True)
+        response.last_modified = g.last_modified
+        response.headers['Cache-Control'] = 'no-cache'
+
+    @app.before_request
+    def check_not_modified():
+        # Answer revalidation from the data version alone, before any DB work
+        if request.method != 'GET' or request.endpoint not in CONDITIONAL_ENDPOINTS:
+            return None
+        g.etag = data_version.etag(request.full_path)
+        # HTTP dates have whole seconds, so the time of the last write is
+        # rounded up. While that second is still running another write can
+        # land in it, so the rounded down time is sent instead, which never
+        # validates.
+        modified = data_version.last_modified()
+        settled = datetime.fromtimestamp(math.ceil(modified), timezone.utc)
+        if math.ceil(modified) <= time.time():
+            g.last_modified = settled
+        else:
+            g.last_modified = datetime.fromtimestamp(int(modified), timezone.utc)
+
+        if request.if_none_match:
+            not_modified = request.if_none_match.contains_weak(g.etag)
+        else:
+            not_modified = request.if_modified_since is not None \
+                and request.if_modified_since >= settled
+        if not_modified:
+            response = Response(status=304)
+            set_validators(response)
+            return response
+        return None
+
     @app.after_request
     def after_request(response):
         response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,true')
         response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
+        if 'etag' in g and response.status_code == 200:
+            set_validators(response)
         return response
 
     @app.route('/categories', methods=['GET'])
     def get_categories():
         try:
-            categories = Category.query.all()
-            formatted_categories = {category.id: category.type for category in categories}
             return jsonify({
                 'success': True,
-                'categories': formatted_categories
+                'categories': categories.all()
             })
         except Exception as e:
             abort(500)
@@ -42,26 +236,31 @@ def create_app(test_config=None):
     def get_questions():
         try:
             page = request.args.get('page', 1, type=int)
-            start = (page - 1) * QUESTIONS_PER_PAGE
-            end = start + QUESTIONS_PER_PAGE
+            after_id = request.args.get('after_id', None, type=int)
+            fields = requested_fields()
+            # Embedded unless the client asks for something else
+            includes = requested_includes(default=['categories'])
+            if page < 1:
+                abort(404)
+
+            # Keyset cursor: clients pass the last id they saw instead of a page
+            query = Question.select_columns(fields).order_by(Question.id)
+            if after_id is not None:
+                query = query.filter(Question.id > after_id)
+            else:
+                query = query.offset((page - 1) * QUESTIONS_PER_PAGE)
 
-            questions = Question.query.order_by(Question.id).all()
-            formatted_questions = [question.format() for question in questions]
-            current_questions = formatted_questions[start:end]
+            current_questions = [Question.format_row(row, fields) for row in query.limit(QUESTIONS_PER_PAGE)]
 
             if len(current_questions) == 0:
                 abort(404)
 
-            categories = Category.query.all()
-            formatted_categories = {category.id: category.type for category in categories}
-
-            return jsonify({
+            return jsonify(embed({
                 'success': True,
                 'questions': current_questions,
-                'total_questions': len(formatted_questions),
-                'categories': formatted_categories,
+                'total_questions': count_questions(),
                 'current_category': None
-            })
+            }, includes))
         except Exception as e:
             if isinstance(e, HTTPException):
                 abort(e.code)
@@ -70,11 +269,11 @@ def create_app(test_config=None):
     @app.route('/questions/<int:question_id>', methods=['DELETE'])
     def delete_question(question_id):
         try:
-            question = Question.query.get(question_id)
-            if question is None:
+            deleted = Question.delete_where(Question.id == question_id)
+            if not deleted:
                 abort(422)
 
-            question.delete()
+            invalidate_question_caches(deleted)
             return jsonify({
                 'success': True,
                 'deleted': question_id
@@ -84,27 +283,60 @@ def create_app(test_config=None):
                 abort(e.code)
             abort(422)
 
-    @app.route('/questions', methods=['POST'])
-    def create_question():
+    @app.route('/questions', methods=['DELETE'])
+    def delete_questions():
         try:
             body = request.get_json()
             if not body:
                 abort(400)
 
-            new_question = body.get('question', None)
-            new_answer = body.get('answer', None)
-            new_category = body.get('category', None)
-            new_difficulty = body.get('difficulty', None)
+            criteria = []
+            if 'ids' in body:
+                ids = body['ids']
+                # bool is an int subclass, and true would delete question 1
+                if not isinstance(ids, list) or not all(
+                    isinstance(i, int) and not isinstance(i, bool) for i in ids
+                ):
+                    abort(400)
+                if len(ids) > app.config.get('BATCH_DELETE_LIMIT', BATCH_DELETE_LIMIT):
+                    abort(400)
+                criteria.append(Question.id.in_(ids))
+            if any(isinstance(body.get(name), bool) for name in ('category', 'difficulty')):
+                abort(400)
+            if 'category' in body:
+                criteria.append(Question.category == int(body['category']))
+            if 'difficulty' in body:
+                criteria.append(Question.difficulty == int(body['difficulty']))
+            # Never turn a malformed request into "delete everything"
+            if not criteria:
+                abort(400)
+
+            deleted = Question.delete_where(*criteria)
+            invalidate_question_caches(deleted)
+            return jsonify({
+                'success': True,
+                'deleted': sorted(row.id for row in deleted),
+                'total_deleted': len(deleted)
+            })
+        except (TypeError, ValueError):
+            abort(400)
+        except Exception as e:
+            if isinstance(e, HTTPException):
+                abort(e.code)
+            abort(422)
 
-            if not all([new_question, new_answer, new_category, new_difficulty]):
+    @app.route('/questions', methods=['POST'])
+    def create_question():
+        try:
+            body = request.get_json()
+            if not body:
                 abort(400)
 
-            question = Question(
-                question=new_question,
-                answer=new_answer,
-                category=new_category,
-                difficulty=new_difficulty
-            )
+            values, error = validate_question(body, categories)
+            if error:
+                abort(error)
+
+            question = Question(**values)
             question.insert()
 
             return jsonify({
@@ -116,6 +348,86 @@ def create_app(test_config=None):
                 abort(e.code)
             abort(422)
 
+    @app.route('/questions/bulk', methods=['POST'])
+    def bulk_create_questions():
+        try:
+            batch_size = request.args.get(
+                'batch_size', app.config.get('BULK_BATCH_SIZE', BULK_BATCH_SIZE), type=int
+            )
+            if batch_size < 1:
+                abort(400)
+
+            # Rows are read from the body as they are inserted, never all at once
+            if request.mimetype in NDJSON_MIMETYPES:
+                rows = iter_ndjson(request.stream)
+            else:
+                rows = iter_json_array(request.stream)
+
+            summary = import_questions(rows, categories, batch_size=batch_size)
+            return jsonify(dict(summary, success=True))
+        except ValueError:
+            abort(400)
+        except Exception as e:
+            if isinstance(e, HTTPException):
+                abort(e.code)
+            abort(422)
+
+    @app.route('/questions/export', methods=['GET'])
+    def export_questions():
+        export_format = request.args.get('format', 'ndjson')
+        # type=int would drop a malformed filter and export everything
+        try:
+            category_id, difficulty = (
+                int(request.args[name]) if name in request.args else None
+                for name in ('category', 'difficulty')
+            )
+        except ValueError:
+            abort(400)
+        if export_format not in ('ndjson', 'csv'):
+            abort(400)
+        if category_id is not None and not categories.exists(category_id):
+            abort(404)
+
+        query = db.session.query(*[getattr(Question, column) for column in EXPORT_COLUMNS])
+        if category_id is not None:
+            query = query.filter(Question.category == category_id)
+        if difficulty is not None:
+            query = query.filter(Question.difficulty == difficulty)
+        # yield_per streams rows from a server-side cursor where the driver has one
+        query = query.order_by(Question.id).yield_per(EXPORT_BATCH_SIZE)
+
+        def generate_ndjson():
+            lines = []
+            for row in query:
+                lines.append(app.json.dumps(Question.format_row(row)))
+                if len(lines) >= EXPORT_BATCH_SIZE:
+                    yield '\n'.join(lines) + '\n'
+                    lines = []
+            if lines:
+                yield '\n'.join(lines) + '\n'
+
+        def generate_csv():
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(EXPORT_COLUMNS)
+            for i, row in enumerate(query, start=1):
+                writer.writerow(row)
+                if i % EXPORT_BATCH_SIZE == 0:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue()
+
+        if export_format == 'csv':
+            generate, mimetype = generate_csv, 'text/csv'
+        else:
+            generate, mimetype = generate_ndjson, 'application/x-ndjson'
+        return Response(
+            stream_with_context(generate()),
+            mimetype=mimetype,
+            headers={'Content-Disposition': f'attachment; filename=questions.{export_format}'}
+        )
+
     @app.route('/questions/search', methods=['POST'])
     def search_questions():
         try:
@@ -123,42 +435,77 @@ def create_app(test_config=None):
             if not body or 'searchTerm' not in body:
                 abort(400)
                 
-            search_term = body.get('searchTerm', '')
-            
-            questions = Question.query.filter(
-                Question.question.ilike(f'%{search_term}%')
-            ).all()
-            
-            formatted_questions = [question.format() for question in questions]
-            
-            return jsonify({
+            # Numbers are searched for as text, as they always have been
+            search_term = body.get('searchTerm')
+            search_term = '' if search_term is None else str(search_term)
+            page = body.get('page', 1)
+            include_answers = body.get('include_answers', False)
+            fuzzy = bool(body.get('fuzzy', False))
+            fields = requested_fields()
+            includes = requested_includes()
+            if not isinstance(page, int) or page < 1:
+                abort(400)
+
+            def run_search():
+                search = search_engine.fuzzy_search if fuzzy else search_engine.search
+                rows, total = search(
+                    search_term,
+                    page=page,
+                    per_page=QUESTIONS_PER_PAGE,
+                    include_answers=bool(include_answers),
+                    fields=fields
+                )
+                return [Question.format_row(row, fields) for row in rows], total
+
+            key = (normalize_term(search_term), page, bool(include_answers), fuzzy, fields)
+            questions, total = search_results.get(key, run_search)
+
+            return jsonify(embed({
                 'success': True,
-                'questions': formatted_questions,
-                'total_questions': len(formatted_questions),
+                'questions': questions,
+                'total_questions': total,
                 'current_category': None
-            })
+            }, includes))
         except Exception as e:
             if isinstance(e, HTTPException):
                 abort(e.code)
             abort(422)
 
+    @app.route('/questions/suggest', methods=['GET'])
+    def suggest_questions():
+        try:
+            prefix = request.args.get('prefix', None)
+            limit = request.args.get('limit', SUGGEST_LIMIT, type=int)
+            if prefix is None or not 1 <= limit <= SUGGEST_MAX_LIMIT:
+                abort(400)
+
+            return jsonify({
+                'success': True,
+                'suggestions': suggestions.suggest(prefix, limit=limit)
+            })
+        except Exception as e:
+            if isinstance(e, HTTPException):
+                abort(e.code)
+            abort(500)
+
     @app.route('/categories/<int:category_id>/questions', methods=['GET'])
     def get_questions_by_category(category_id):
         try:
+            fields = requested_fields()
+            includes = requested_includes()
             # Check if category exists
-            category = Category.query.get(category_id)
-            if not category:
+            if not categories.exists(category_id):
                 abort(404)
                 
-            questions = Question.query.filter_by(category=str(category_id)).all()
-            formatted_questions = [question.format() for question in questions]
+            questions = Question.select_columns(fields).filter(Question.category == category_id)
+            formatted_questions = [Question.format_row(row, fields) for row in questions]
             
-            return jsonify({
+            return jsonify(embed({
                 'success': True,
                 'questions': formatted_questions,
                 'total_questions': len(formatted_questions),
                 'current_category': category_id
-            })
+            }, includes))
         except Exception as e:
             if isinstance(e, HTTPException):
                 abort(e.code)
@@ -171,6 +518,9 @@ def create_app(test_config=None):
             if not body:
                 abort(422)
                 
+            if body.get('progress_token') is not None or body.get('progress'):
+                return play_quiz_with_progress(body)
+
             previous_questions = body.get('previous_questions', [])
             quiz_category = body.get('quiz_category', None)
 
@@ -184,10 +534,9 @@ def create_app(test_config=None):
                 questions = Question.query
             else:
                 # Check if category exists
-                category = Category.query.get(category_id)
-                if not category:
+                if not categories.exists(category_id):
                     abort(422)
-                questions = Question.query.filter_by(category=str(category_id))
+                questions = Question.query.filter_by(category=int(category_id))
 
             # Filter out previous questions
             questions = questions.filter(Question.id.notin_(previous_questions)).all()
@@ -208,6 +557,154 @@ def create_app(test_config=None):
                 abort(e.code)
             abort(422)
 
+    def play_quiz_with_progress(body):
+        # Constant-size request instead of the growing previous_questions list
+        if body.get('progress_token') is not None:
+            try:
+                progress = quiz_progress.loads(body['progress_token'])
+            except ValueError:
+                abort(422)
+        else:
+            quiz_category = body.get('quiz_category', None)
+            if not quiz_category:
+                abort(422)
+            category_id = quiz_category.get('id')
+            if category_id != 0 and not categories.exists(category_id):
+                abort(422)
+            progress = quiz_progress.start(int(category_id))
+
+        category_id, seed, last_id = progress
+        questions = Question.select_columns()
+        if category_id != 0:
+            questions = questions.filter(Question.category == category_id)
+
+        row = quiz_progress.next_row(questions, Question.id, seed, last_id)
+        if row is not None:
+            progress[2] = row.id
+
+        return jsonify({
+            'success': True,
+            'question': Question.format_row(row) if row else None,
+            'progress_token': quiz_progress.dumps(progress)
+        })
+
+    @app.route('/quizzes/sessions', methods=['POST'])
+    def create_quiz_session():
+        try:
+            body = request.get_json()
+            if not body:
+                abort(422)
+
+            quiz_category = body.get('quiz_category', None)
+            if not quiz_category:
+                abort(422)
+
+            category_id = quiz_category.get('id')
+
+            # Only the ids are loaded; each draw fetches a single row
+            question_ids = db.session.query(Question.id)
+            if category_id != 0:
+                if not categories.exists(category_id):
+                    abort(422)
+                question_ids = question_ids.filter(Question.category == int(category_id))
+
+            deck = [question_id for (question_id,) in question_ids]
+            random.shuffle(deck)
+            # A random sample is as good a quiz as the whole category
+            deck = deck[:app.config.get('QUIZ_DECK_SIZE', QUIZ_DECK_SIZE)]
+            session_id = quiz_sessions.create(deck)
+
+            return jsonify({
+                'success': True,
+                'session_id': session_id,
+                'total_questions': len(deck)
+            })
+        except Exception as e:
+            if isinstance(e, HTTPException):
+                abort(e.code)
+            abort(422)
+
+    @app.route('/quizzes/sessions/<session_id>/next', methods=['POST'])
+    def next_quiz_question(session_id):
+        try:
+            while True:
+                question_id = quiz_sessions.draw(session_id)
+                if question_id is None:
+                    question = None
+                    break
+                # Skip questions deleted since the deck was dealt
+                question = db.session.get(Question, question_id)
+                if question is not None:
+                    break
+
+            return jsonify({
+                'success': True,
+                'question': question.format() if question else None
+            })
+        except KeyError:
+            abort(404)
+
+    @app.route('/quizzes/sessions/<session_id>', methods=['DELETE'])
+    def delete_quiz_session(session_id):
+        quiz_sessions.delete(session_id)
+        return jsonify({
+            'success': True,
+            'deleted': session_id
+        })
+
+    @app.route('/batch', methods=['POST'])
+    def run_batch():
+        try:
+            sub_requests = parse_batch(
+                request.get_json(silent=True),
+                app.config.get('BATCH_MAX_SIZE', BATCH_MAX_SIZE)
+            )
+
+            # Run in order in this app context, so they share one database
+            # session; reads after a write go to the primary
+            responses = []
+            wrote = False
+            for method, path, body in sub_requests:
+                status, data = dispatch(app, method, path, body, db_primary=wrote)
+                wrote = wrote or method != 'GET'
+                responses.append({'status': status, 'body': data})
+
+            return jsonify({
+                'success': True,
+                'responses': responses
+            })
+        except ValueError:
+            abort(400)
+        except Exception as e:
+            if isinstance(e, HTTPException):
+                abort(e.code)
+            abort(500)
+
+    @app.route('/health/db', methods=['GET'])
+    def database_health():
+        started = time.perf_counter()
+        try:
+            db.session.execute(text('SELECT 1'))
+            status, code = 'ok', 200
+        except Exception:
+            db.session.rollback()
+            status, code = 'unavailable', 503
+        return jsonify({
+            'success': code == 200,
+            'database': status,
+            'latency_ms': round((time.perf_counter() - started) * 1000, 3),
+            'pool': pool_status()
+        }), code
+
+    @app.route('/metrics', methods=['GET'])
+    def get_metrics():
+        if not app.config.get('METRICS_ENABLED', True):
+            abort(404)
+        return Response(
+            app.extensions['metrics'].render(app.extensions),
+            mimetype=request_metrics.PROMETHEUS_CONTENT_TYPE
+        )
+
     @app.errorhandler(400)
     def bad_request(error):
         return jsonify({
@@ -232,6 +729,17 @@ def create_app(test_config=None):
             'message': 'Unprocessable entity'
         }), 422
 
+    @app.errorhandler(429)
+    def too_many_requests(error):
+        response = jsonify({
+            'success': False,
+            'error': 429,
+            'message': 'Too many requests'
+        })
+        if error.retry_after is not None:
+            response.headers['Retry-After'] = str(error.retry_after)
+        return response, 429
+
     @app.errorhandler(500)
     def server_error(error):
         return jsonify({
@@ -240,5 +748,22 @@ def create_app(test_config=None):
             'message': 'Internal server error'
         }), 500
 
+    if app.config.get('WARM_UP', os.getenv('WARM_UP', '').lower() == 'true'):
+        warm_up(app)
+
     return app
 
+
+def warm_up(app):
+    """
+    Load the category registry, the question count, the search index and
+    the suggestion index and open a pooled connection, so a worker's first
+    requests do not pay for it. create_app calls this when WARM_UP is set; a gunicorn
+    `post_worker_init` hook can call it instead.
+    """
+    with app.app_context():
+        app.extensions['category_registry'].all()
+        app.extensions['question_count'].get()
+        app.extensions['search_engine'].warm_up()
+        app.extensions['suggestions'].warm_up()
+
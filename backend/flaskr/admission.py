@@ -0,0 +1,135 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from flask import abort, g, request
+
+
+class RateLimitBackend:
+    """
+    Interface for token bucket storage.
+
+    Buckets hold up to `burst` tokens and refill at `rate` tokens per
+    second. A shared backend lets every worker enforce the same per-client
+    budget, e.g. with a Redis script doing the same arithmetic.
+    """
+
+    def take(self, key, rate, burst):
+        """
+        Take one token from the bucket of `key`.
+
+        Returns 0 when a token was taken, otherwise the number of seconds
+        until the next one is available.
+        """
+        raise NotImplementedError
+
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    """
+    Process-local buckets for at most `max_keys` clients, forgetting the
+    least recently seen one. A forgotten client starts again with a full
+    bucket.
+    """
+
+    def __init__(self, max_keys=100000, clock=time.monotonic):
+        self.max_keys = max_keys
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+
+    def take(self, key, rate, burst):
+        now = self.clock()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                wait = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class ConcurrencyLimiter:
+    """
+    Lets at most `limit` requests run at once in this process. Up to
+    `max_queue` more wait for a slot for at most `timeout` seconds; the
+    rest are turned away immediately.
+    """
+
+    def __init__(self, limit, max_queue=0, timeout=0):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+        self.waiting = 0
+
+    def acquire(self):
+        if self._slots.acquire(blocking=False):
+            return True
+        with self._lock:
+            if self.waiting >= self.max_queue:
+                return False
+            self.waiting += 1
+        try:
+            return self._slots.acquire(timeout=self.timeout)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+
+    def release(self):
+        self._slots.release()
+
+
+class AdmissionController:
+    """
+    Admission control for expensive endpoints: a token bucket per client,
+    then a slot under the global concurrency limit. `rate` or `limiter`
+    set to None turns that check off.
+    """
+
+    def __init__(self, backend, rate=None, burst=1, limiter=None):
+        self.backend = backend
+        self.rate = rate
+        self.burst = burst
+        self.limiter = limiter
+
+    def admit(self, client):
+        """Return (None, None) when admitted, else (reason, retry_after seconds)."""
+        if self.rate:
+            wait = self.backend.take(client, self.rate, self.burst)
+            if wait:
+                return 'rate_limit', wait
+        if self.limiter is not None and not self.limiter.acquire():
+            return 'concurrency', self.limiter.timeout or 1
+        return None, None
+
+    def release(self):
+        if self.limiter is not None:
+            self.limiter.release()
+
+
+def init_app(app, controller, endpoints, metrics=None):
+    """Run every request to one of `endpoints` through `controller`."""
+
+    @app.before_request
+    def admit_request():
+        if request.endpoint not in endpoints:
+            return
+        reason, retry_after = controller.admit(request.remote_addr or 'unknown')
+        if reason is None:
+            g.admission_slot = True
+            return
+        if metrics is not None:
+            metrics.observe_rejection(request.endpoint, reason)
+        abort(429, retry_after=max(1, math.ceil(retry_after)))
+
+    @app.teardown_request
+    def release_slot(exception):
+        if g.pop('admission_slot', False):
+            controller.release()
@@ -0,0 +1,84 @@
+from contextlib import contextmanager
+
+from flask import g, request
+from werkzeug.test import EnvironBuilder
+
+from models import db
+
+BATCH_METHODS = {'GET', 'POST', 'DELETE'}
+
+
+def parse_batch(items, max_size):
+    """
+    Validate the body of a batch request and return (method, path, body)
+    for each sub-request. Raises ValueError when any of them is invalid, so
+    nothing runs unless the whole batch can.
+    """
+    if not isinstance(items, list) or not 1 <= len(items) <= max_size:
+        raise ValueError('expected an array of 1 to %d requests' % max_size)
+    parsed = []
+    for item in items:
+        if not isinstance(item, dict):
+            raise ValueError('expected an object')
+        method = str(item.get('method', 'GET')).upper()
+        path = item.get('path')
+        if method not in BATCH_METHODS or not isinstance(path, str) or not path.startswith('/'):
+            raise ValueError('invalid method or path')
+        if path.split('?', 1)[0].rstrip('/') == request.path:
+            raise ValueError('batches cannot be nested')
+        parsed.append((method, path, item.get('body')))
+    return parsed
+
+
+@contextmanager
+def _fresh_globals(**values):
+    # g belongs to the app context, which sub-requests share with the batch,
+    # so each one gets its own and the batch's is put back afterwards
+    saved = {name: g.pop(name) for name in list(g)}
+    for name, value in values.items():
+        setattr(g, name, value)
+    try:
+        yield
+    finally:
+        for name in list(g):
+            g.pop(name)
+        for name, value in saved.items():
+            setattr(g, name, value)
+
+
+def dispatch(app, method, path, body=None, **values):
+    """
+    Run one sub-request through `app`, with its hooks and error handlers,
+    and return (status, body).
+
+    The current app context, and so the database session, is reused. It is
+    rolled back after a failed sub-request, so that the failure does not
+    break the ones after it. Extra `values` are set on the sub-request's g.
+    """
+    builder = EnvironBuilder(
+        path=path,
+        method=method,
+        json=body,
+        environ_base={'REMOTE_ADDR': request.remote_addr}
+    )
+    try:
+        environ = builder.get_environ()
+    finally:
+        builder.close()
+
+    with _fresh_globals(**values), app.request_context(environ):
+        try:
+            response = app.full_dispatch_request()
+        except Exception:
+            db.session.rollback()
+            raise
+        if response.status_code >= 400:
+            db.session.rollback()
+        try:
+            if response.is_json:
+                data = response.get_json()
+            else:
+                data = response.get_data(as_text=True)
+        finally:
+            response.close()
+    return response.status_code, data
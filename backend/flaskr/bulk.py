@@ -0,0 +1,239 @@
+import codecs
+import json
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import Question, db
+from .cache import invalidate_question_caches
+
+ERROR_MESSAGES = {
+    400: 'Bad request',
+    422: 'Unprocessable entity'
+}
+
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/jsonl')
+
+# Largest single row accepted in an upload, in characters
+MAX_ITEM_SIZE = 1024 * 1024
+# Decode errors this close to the end of the buffer are retried with more data
+INCOMPLETE_MARGIN = 16
+NUMBER_CHARS = '0123456789+-.eE'
+
+
+def validate_question(body, categories):
+    """
+    Apply the POST /questions rules to `body`.
+
+    Returns `(values, None)` with the column values to insert, or
+    `(None, status_code)` when the row is rejected.
+    """
+    if not isinstance(body, dict):
+        return None, 400
+
+    new_question = body.get('question', None)
+    new_answer = body.get('answer', None)
+    new_category = body.get('category', None)
+    new_difficulty = body.get('difficulty', None)
+
+    if not all([new_question, new_answer, new_category, new_difficulty]):
+        return None, 400
+    if not isinstance(new_question, str) or not isinstance(new_answer, str):
+        return None, 400
+
+    # The form sends the difficulty as a numeric string
+    if isinstance(new_difficulty, str) and new_difficulty.strip().isdigit():
+        new_difficulty = int(new_difficulty)
+    # Bounded by the INTEGER column
+    if not isinstance(new_difficulty, int) or isinstance(new_difficulty, bool) \
+            or not -2 ** 31 <= new_difficulty < 2 ** 31:
+        return None, 400
+
+    # Accept the category id as an integer or as a numeric string
+    try:
+        new_category = int(new_category)
+    except (TypeError, ValueError):
+        return None, 400
+    if not categories.exists(new_category):
+        return None, 422
+
+    return {
+        'question': new_question,
+        'answer': new_answer,
+        'category': new_category,
+        'difficulty': new_difficulty
+    }, None
+
+
+def iter_ndjson(stream, chunk_size=65536, max_item_size=MAX_ITEM_SIZE):
+    """
+    Yield one decoded value per non-blank line, or ValueError for bad lines.
+    A line longer than `max_item_size` is yielded as a ValueError and ends
+    the iteration.
+    """
+    # Reading whole chunks is much faster than readline() on a request stream
+    pending = b''
+    while True:
+        chunk = stream.read(chunk_size)
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop() if chunk else b''
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                yield e
+        if len(pending) > max_item_size:
+            yield ValueError('NDJSON line too long')
+            return
+        if not chunk:
+            return
+
+
+def _incomplete(error, buffer):
+    """Whether a decode error may only mean that the item goes on past the end of `buffer`."""
+    # A string, or a token such as `tru` or `1e`, cut short by the end of the chunk
+    return error.pos + INCOMPLETE_MARGIN > len(buffer) or error.msg.startswith('Unterminated string')
+
+
+def iter_json_array(stream, chunk_size=65536, max_item_size=MAX_ITEM_SIZE):
+    """
+    Yield the items of a top-level JSON array read incrementally from
+    `stream`, so only the current chunk and item are held in memory.
+
+    Raises ValueError when the body is not a JSON array at all; a syntax
+    error later on, or an item longer than `max_item_size`, is yielded as a
+    ValueError and ends the iteration.
+    """
+    decoder = json.JSONDecoder()
+    decode = codecs.getincrementaldecoder('utf-8')().decode
+    buffer, pos, eof = '', 0, False
+    decode_error = None
+    # What may come next: '[' to open, then an item or ']', then ',' or ']'
+    state = 'open'
+
+    def fill():
+        """Read the next chunk; returns an error once the body stops being valid UTF-8."""
+        nonlocal buffer, pos, eof, decode_error
+        if decode_error is not None:
+            return decode_error
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        try:
+            text = decode(chunk, final=eof)
+        except UnicodeDecodeError as e:
+            # Keep the text before the bad bytes, so the rows in it are still
+            # read and the error lands on the row holding them
+            text = e.object[:e.start].decode('utf-8')
+            decode_error = e
+        buffer = buffer[pos:] + text
+        pos = 0
+        return None
+
+    while True:
+        while pos < len(buffer) and buffer[pos].isspace():
+            pos += 1
+        if pos == len(buffer):
+            if eof:
+                yield ValueError('Unexpected end of JSON array')
+                return
+            error = fill()
+            if error:
+                yield error
+                return
+            continue
+
+        char = buffer[pos]
+        if state == 'open':
+            if char != '[':
+                raise ValueError('Expected a JSON array')
+            state = 'first'
+            pos += 1
+        elif char == ']' and state in ('first', 'separator'):
+            return
+        elif char == ',' and state == 'separator':
+            state = 'item'
+            pos += 1
+        elif state in ('first', 'item'):
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except ValueError as e:
+                # Only read on when the item may just be cut off by the chunk
+                if eof or not _incomplete(e, buffer):
+                    yield e
+                    return
+                end = len(buffer)
+            # The item, or a number such as `1.` or `1e`, could continue in the next chunk
+            if not eof and (end == len(buffer) or isinstance(item, (int, float))
+                            and not buffer[end:].strip(NUMBER_CHARS)):
+                if len(buffer) - pos > max_item_size:
+                    yield ValueError('JSON array item too large')
+                    return
+                error = fill()
+                if error:
+                    yield error
+                    return
+                continue
+            pos = end
+            state = 'separator'
+            yield item
+        else:
+            yield ValueError(f'Unexpected {char!r} in JSON array')
+            return
+
+
+def import_questions(rows, categories, batch_size=1000, max_errors=1000):
+    """
+    Validate and insert `rows` in batches of `batch_size` with one
+    executemany INSERT and commit per batch. When the database rejects a
+    batch its rows are inserted one by one, so only the failing rows are
+    reported.
+
+    Returns a summary with the number of inserted rows and up to
+    `max_errors` per-row errors, indexed by position in the upload.
+    """
+    inserted = failed = 0
+    errors = []
+    batch, batch_indexes = [], []
+
+    def report(index, code):
+        nonlocal failed
+        failed += 1
+        if len(errors) < max_errors:
+            errors.append({'index': index, 'error': code, 'message': ERROR_MESSAGES[code]})
+
+    def flush():
+        nonlocal inserted
+        try:
+            db.session.execute(Question.__table__.insert(), batch)
+            db.session.commit()
+            inserted += len(batch)
+        except SQLAlchemyError:
+            db.session.rollback()
+            for index, values in zip(batch_indexes, batch):
+                try:
+                    db.session.execute(Question.__table__.insert(), [values])
+                    db.session.commit()
+                    inserted += 1
+                except SQLAlchemyError:
+                    db.session.rollback()
+                    report(index, 422)
+        invalidate_question_caches()
+        batch.clear()
+        batch_indexes.clear()
+
+    for index, row in enumerate(rows):
+        values, error = (None, 400) if isinstance(row, ValueError) else validate_question(row, categories)
+        if error:
+            report(index, error)
+            continue
+        batch.append(values)
+        batch_indexes.append(index)
+        if len(batch) >= batch_size:
+            flush()
+
+    if batch:
+        flush()
+
+    return {'inserted': inserted, 'failed': failed, 'errors': errors}
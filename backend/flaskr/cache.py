@@ -0,0 +1,316 @@
+import hashlib
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+
+from models import Question, Category
+
+
+class CachedValue:
+    """
+    Holds the result of `loader()` for `ttl` seconds.
+
+    Writes in this process call `invalidate()`; the TTL bounds how stale the
+    value can get after writes made by other processes.
+    """
+
+    def __init__(self, loader, ttl=30):
+        self.loader = loader
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._value = None
+        self._expires = 0
+        self._generation = 0
+
+    def get(self):
+        with self._lock:
+            if self._value is not None and time.monotonic() < self._expires:
+                self.hits += 1
+                return self._value
+            self.misses += 1
+            generation = self._generation
+
+        value = self.loader()
+
+        with self._lock:
+            # Don't store a value that was read before an invalidation landed
+            if generation == self._generation:
+                self._value = value
+                self._expires = time.monotonic() + self.ttl
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self._value = None
+            self._generation += 1
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+class CategoryRegistry(CachedValue):
+    """
+    In-memory copy of the categories table as an `{id: type}` map.
+
+    Categories almost never change, so every endpoint reads them from here
+    instead of querying the table on each request.
+    """
+
+    def __init__(self, ttl=300):
+        super().__init__(self._load, ttl=ttl)
+
+    @staticmethod
+    def _load():
+        categories = Category.query.order_by(Category.id).all()
+        return {category.id: category.type for category in categories}
+
+    def all(self):
+        return self.get()
+
+    def exists(self, category_id):
+        try:
+            return int(category_id) in self.get()
+        except (TypeError, ValueError):
+            return False
+
+    def stats(self):
+        stats = super().stats()
+        stats['size'] = len(self._value) if self._value is not None else 0
+        return stats
+
+
+class DataVersion:
+    """
+    Counter bumped by every write to questions or categories in this process,
+    used to build ETags for the read endpoints.
+
+    ETags also include a per-process id, so a tag handed out by another
+    worker never matches here, and the current `ttl` window, so writes made
+    by other processes are picked up within `ttl` seconds.
+    """
+
+    def __init__(self, ttl=30):
+        self.ttl = ttl
+        self.value = 0
+        self._instance = secrets.token_hex(4)
+        self._lock = threading.Lock()
+        self._modified = time.time()
+
+    def invalidate(self):
+        with self._lock:
+            self.value += 1
+            self._modified = time.time()
+
+    def _window(self):
+        return int(time.time() // self.ttl) if self.ttl else 0
+
+    def etag(self, key):
+        tag = f'{self._instance}:{self.value}:{self._window()}:{key}'
+        return hashlib.sha1(tag.encode('utf-8')).hexdigest()
+
+    def last_modified(self):
+        if not self.ttl:
+            return self._modified
+        return max(self._modified, self._window() * self.ttl)
+
+
+class LazyIndex:
+    """
+    Base for in-memory indexes built from the database on first use and then
+    kept up to date by the writes of this process.
+
+    Subclasses implement `_read()`, which queries the data to index without
+    holding the lock, and `_build(data)` and `_clear()`, which run under it.
+    Lookups run in `with self._loaded():` and updates go through
+    `_write(apply, ...)`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ready = False
+        # Bumped by writes while the index is not loaded, so a build that
+        # may have read the table before them is thrown away
+        self._generation = 0
+
+    def _read(self):
+        raise NotImplementedError
+
+    def _build(self, data):
+        raise NotImplementedError
+
+    def _clear(self):
+        raise NotImplementedError
+
+    def _ensure_loaded(self):
+        while True:
+            with self._lock:
+                if self._ready:
+                    return
+                generation = self._generation
+            data = self._read()
+            with self._lock:
+                if self._ready:
+                    return
+                if generation == self._generation:
+                    self._build(data)
+                    self._ready = True
+                    return
+
+    @contextmanager
+    def _loaded(self):
+        """Hold the lock over a loaded index, loading it again if it was invalidated meanwhile."""
+        while True:
+            self._ensure_loaded()
+            self._lock.acquire()
+            if self._ready:
+                break
+            self._lock.release()
+        try:
+            yield
+        finally:
+            self._lock.release()
+
+    def _write(self, apply, *args):
+        """Call `apply(*args)` under the lock when the index is loaded."""
+        with self._lock:
+            if self._ready:
+                apply(*args)
+            else:
+                self._generation += 1
+
+    def warm_up(self):
+        self._ensure_loaded()
+
+    def invalidate(self):
+        with self._lock:
+            self._ready = False
+            self._clear()
+            self._generation += 1
+
+
+def normalize_term(term):
+    """
+    Lower-case `term` the way tokenize() does and collapse its whitespace, so
+    equivalent searches share a key.
+    """
+    return ' '.join(term.lower().split())
+
+
+class SearchResultCache:
+    """
+    LRU cache of search result pages, at most `max_entries` of them, each
+    kept for at most `ttl` seconds.
+
+    Question writes in this process call `invalidate()`; the TTL bounds how
+    stale a page can get after writes made by other processes.
+    """
+
+    def __init__(self, max_entries=1024, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._generation = 0
+
+    def get(self, key, loader):
+        """Return the cached value of `key`, calling `loader()` on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() < entry[1]:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            generation = self._generation
+
+        value = loader()
+
+        with self._lock:
+            if generation == self._generation and self.max_entries:
+                self._entries[key] = (value, time.monotonic() + self.ttl)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+
+# Caches derived from the questions table, dropped by writes that bypass the
+# ORM mapper events such as bulk inserts
+QUESTION_CACHES = ['question_count', 'search_engine', 'search_results', 'suggestions', 'data_version']
+
+
+def _invalidate(name):
+    if not has_app_context():
+        return
+    cache = current_app.extensions.get(name)
+    if cache is not None:
+        cache.invalidate()
+
+
+def invalidate_question_caches(deleted=None):
+    """
+    Drop the question caches after a write that bypassed the mapper events.
+    Caches that can forget single questions are told which (id, question)
+    rows were deleted instead.
+    """
+    for name in QUESTION_CACHES:
+        cache = current_app.extensions.get(name) if has_app_context() else None
+        if deleted is not None and hasattr(cache, 'remove'):
+            for question_id, question in deleted:
+                cache.remove(question_id, question)
+        else:
+            _invalidate(name)
+
+
+@event.listens_for(Question, 'after_insert')
+@event.listens_for(Question, 'after_delete')
+def _invalidate_question_count(mapper, connection, target):
+    _invalidate('question_count')
+
+
+@event.listens_for(Question, 'after_insert')
+@event.listens_for(Question, 'after_update')
+@event.listens_for(Question, 'after_delete')
+@event.listens_for(Category, 'after_insert')
+@event.listens_for(Category, 'after_update')
+@event.listens_for(Category, 'after_delete')
+def _bump_data_version(mapper, connection, target):
+    _invalidate('data_version')
+
+
+@event.listens_for(Category, 'after_insert')
+@event.listens_for(Category, 'after_update')
+@event.listens_for(Category, 'after_delete')
+def _invalidate_categories(mapper, connection, target):
+    _invalidate('category_registry')
+
+
+@event.listens_for(Question, 'after_insert')
+@event.listens_for(Question, 'after_update')
+@event.listens_for(Question, 'after_delete')
+def _invalidate_search_results(mapper, connection, target):
+    _invalidate('search_results')
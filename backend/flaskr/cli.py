@@ -0,0 +1,151 @@
+import os
+import re
+from datetime import datetime, timezone
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import inspect, select, text
+
+from models import SchemaMigration, Question, Category, db
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MIGRATIONS_DIR = os.path.join(BACKEND_DIR, 'migrations')
+SEED_FILE = os.path.join(BACKEND_DIR, 'trivia.psql')
+
+COPY_RE = re.compile(r'^COPY (?:\w+\.)?(\w+) \(([^)]*)\) FROM stdin;$')
+COPY_ESCAPES = {'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t', 'v': '\v'}
+
+
+def migration_files():
+    """Return (version, path) for every file in migrations/, in order."""
+    return [
+        (os.path.splitext(name)[0], os.path.join(MIGRATIONS_DIR, name))
+        for name in sorted(os.listdir(MIGRATIONS_DIR)) if name.endswith('.sql')
+    ]
+
+
+def create_schema(drop=False):
+    """
+    Create the tables and the search backend's schema.
+
+    Migrations are recorded as applied when the tables are new, since the
+    models already match the latest migration.
+    """
+    fresh = drop or not inspect(db.engine).has_table(Question.__tablename__)
+    # Only the primary; replicas get the schema through replication
+    if drop:
+        db.drop_all(bind_key=None)
+    db.create_all(bind_key=None)
+    current_app.extensions['search_engine'].ensure_schema()
+    if fresh:
+        now = datetime.now(timezone.utc)
+        applied = set(db.session.scalars(select(SchemaMigration.version)))
+        for version, _ in migration_files():
+            if version not in applied:
+                db.session.add(SchemaMigration(version=version, applied_at=now))
+        db.session.commit()
+    return fresh
+
+
+def _copy_value(value, column):
+    if value == r'\N':
+        return None
+    value = re.sub(r'\\(.)', lambda m: COPY_ESCAPES.get(m.group(1), m.group(1)), value)
+    return column.type.python_type(value)
+
+
+def read_copy_data(path):
+    """Yield (table, rows) for every `COPY ... FROM stdin` block of a pg_dump file."""
+    table = columns = rows = None
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if table is None:
+                match = COPY_RE.match(line)
+                if match and match.group(1) in db.metadata.tables:
+                    table = db.metadata.tables[match.group(1)]
+                    columns = [table.c[name.strip()] for name in match.group(2).split(',')]
+                    rows = []
+            elif line == '\\.':
+                yield table, rows
+                table = None
+            else:
+                values = line.split('\t')
+                rows.append({column.name: _copy_value(value, column) for column, value in zip(columns, values)})
+
+
+def load_seed_data(path=SEED_FILE):
+    """Insert the rows of `path` into empty tables; returns the rows inserted per table."""
+    if db.session.query(Category.id).first() is not None:
+        return {}
+    loaded = {}
+    for table, rows in read_copy_data(path):
+        if rows:
+            db.session.execute(table.insert(), rows)
+        loaded[table.name] = len(rows)
+        if db.engine.dialect.name == 'postgresql' and 'id' in table.c:
+            # Explicit ids do not advance the serial sequence
+            db.session.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+                f"coalesce(max(id), 1), max(id) IS NOT NULL) FROM {table.name}"
+            ))
+    db.session.commit()
+    return loaded
+
+
+def apply_migrations():
+    """Run the files in migrations/ that have not been applied yet; returns their versions."""
+    SchemaMigration.__table__.create(db.engine, checkfirst=True)
+    applied = set(db.session.scalars(select(SchemaMigration.version)))
+    db.session.commit()
+    pending = [(version, path) for version, path in migration_files() if version not in applied]
+
+    for version, path in pending:
+        with open(path, encoding='utf-8') as f:
+            script = f.read()
+        # The files manage their own transactions. The pool resets the
+        # isolation level when the connection is returned, so it does not
+        # hand out an autocommit connection afterwards
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            connection.exec_driver_sql(script)
+        db.session.add(SchemaMigration(version=version, applied_at=datetime.now(timezone.utc)))
+        db.session.commit()
+    return [version for version, _ in pending]
+
+
+@click.command('init-db')
+@click.option('--drop', is_flag=True, help='Drop every table first.')
+@click.option('--seed/--no-seed', default=True, help='Load the sample questions into empty tables.')
+@click.option('--seed-file', default=SEED_FILE, show_default=True, help='pg_dump file to read COPY data from.')
+@with_appcontext
+def init_db_command(drop, seed, seed_file):
+    """Create the schema and load the sample data."""
+    if drop:
+        click.confirm('Drop every table?', abort=True)
+    fresh = create_schema(drop=drop)
+    click.echo('Created the schema.' if fresh else 'Schema already present; created missing tables only.')
+    if seed:
+        loaded = load_seed_data(seed_file)
+        if loaded:
+            click.echo('Loaded ' + ', '.join(f'{count} {table}' for table, count in loaded.items()) + '.')
+        else:
+            click.echo('Tables already hold data; skipped the seed data.')
+
+
+@click.command('migrate-db')
+@with_appcontext
+def migrate_db_command():
+    """Apply the pending files in migrations/."""
+    dialect = db.engine.dialect.name
+    if dialect != 'postgresql':
+        click.echo(f'The migrations are written for PostgreSQL; nothing to do on {dialect}.')
+        return
+    applied = apply_migrations()
+    current_app.extensions['search_engine'].ensure_schema()
+    click.echo(f'Applied {", ".join(applied)}.' if applied else 'Already up to date.')
+
+
+def register_commands(app):
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(migrate_db_command)
@@ -0,0 +1,111 @@
+import gzip
+import threading
+from collections import OrderedDict
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'application/x-ndjson', 'text/csv', 'text/plain', 'text/html')
+
+# Preferred first when the client accepts several with the same quality
+DEFAULT_LEVELS = {'br': 4, 'zstd': 3, 'gzip': 6}
+
+
+def _encoders():
+    encoders = {}
+    if brotli is not None:
+        encoders['br'] = lambda data, level: brotli.compress(data, quality=level)
+    if zstandard is not None:
+        encoders['zstd'] = lambda data, level: zstandard.ZstdCompressor(level=level).compress(data)
+    # mtime=0 keeps the output identical for identical bodies
+    encoders['gzip'] = lambda data, level: gzip.compress(data, compresslevel=level, mtime=0)
+    return encoders
+
+
+class Compressor:
+    """
+    Compresses response bodies with the best encoding the client accepts.
+
+    Bodies of responses with an ETag are the same for as long as the tag is,
+    so their compressed bytes are kept in an LRU cache of `cache_size`
+    entries keyed by tag and encoding.
+    """
+
+    def __init__(self, min_size=500, levels=None, cache_size=256, encodings=None):
+        self.min_size = min_size
+        self.levels = {**DEFAULT_LEVELS, **(levels or {})}
+        self.encoders = {
+            name: encoder for name, encoder in _encoders().items()
+            if encodings is None or name in encodings
+        }
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def negotiate(self, accept_encodings):
+        """Return the accepted encoding with the highest quality, or None."""
+        best, best_quality = None, 0
+        for name in self.encoders:
+            quality = accept_encodings.quality(name)
+            if quality > best_quality:
+                best, best_quality = name, quality
+        return best
+
+    def compress(self, data, encoding, etag=None):
+        if etag is None or not self.cache_size:
+            return self.encoders[encoding](data, self.levels[encoding])
+
+        key = (etag, encoding)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return self._cache[key]
+            self.misses += 1
+
+        compressed = self.encoders[encoding](data, self.levels[encoding])
+        with self._lock:
+            self._cache[key] = compressed
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return compressed
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._cache)}
+
+
+def init_app(app, compressor):
+    """Compress the responses of `app` that are worth it."""
+
+    @app.after_request
+    def compress_response(response):
+        if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+            return response
+        response.vary.add('Accept-Encoding')
+
+        if response.status_code != 200 or response.direct_passthrough or response.is_streamed \
+                or 'Content-Encoding' in response.headers:
+            return response
+        encoding = compressor.negotiate(request.accept_encodings)
+        if encoding is None:
+            return response
+        data = response.get_data()
+        if len(data) < compressor.min_size:
+            return response
+
+        etag, _ = response.get_etag()
+        response.set_data(compressor.compress(data, encoding, etag))
+        response.headers['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,191 @@
+import bisect
+import threading
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from models import pool_status
+
+# Latency buckets in seconds, the Prometheus client defaults
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield bound, total
+
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _bound(value):
+    return '+Inf' if value == float('inf') else repr(value)
+
+
+class Metrics:
+    """
+    Per-endpoint request counters and latency histograms, plus the number of
+    SQL statements and the time spent in the database for each endpoint.
+
+    Recording a request is a few dict updates under one lock, so it is cheap
+    enough to leave on in production.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self.requests = {}
+        self.latency = {}
+        self.db_queries = {}
+        self.db_seconds = {}
+        self.rejections = {}
+
+    def observe_request(self, endpoint, method, status, seconds, queries=0, db_seconds=0.0):
+        with self._lock:
+            key = (endpoint, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            if endpoint not in self.latency:
+                self.latency[endpoint] = Histogram(self.buckets)
+            self.latency[endpoint].observe(seconds)
+            self.db_queries[endpoint] = self.db_queries.get(endpoint, 0) + queries
+            self.db_seconds[endpoint] = self.db_seconds.get(endpoint, 0.0) + db_seconds
+
+    def observe_rejection(self, endpoint, reason):
+        with self._lock:
+            key = (endpoint, reason)
+            self.rejections[key] = self.rejections.get(key, 0) + 1
+
+    def render(self, extensions=None):
+        """Return every metric in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            lines += [
+                '# HELP trivia_http_requests_total Requests handled, by endpoint, method and status.',
+                '# TYPE trivia_http_requests_total counter',
+            ]
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                lines.append(f'trivia_http_requests_total{_labels(endpoint=endpoint, method=method, status=status)} {count}')
+
+            lines += [
+                '# HELP trivia_http_request_duration_seconds Request latency, by endpoint.',
+                '# TYPE trivia_http_request_duration_seconds histogram',
+            ]
+            for endpoint, histogram in sorted(self.latency.items()):
+                for bound, count in histogram.cumulative():
+                    lines.append(f'trivia_http_request_duration_seconds_bucket{_labels(endpoint=endpoint, le=_bound(bound))} {count}')
+                lines.append(f'trivia_http_request_duration_seconds_sum{_labels(endpoint=endpoint)} {histogram.sum}')
+                lines.append(f'trivia_http_request_duration_seconds_count{_labels(endpoint=endpoint)} {histogram.count}')
+
+            lines += [
+                '# HELP trivia_db_queries_total SQL statements executed, by endpoint.',
+                '# TYPE trivia_db_queries_total counter',
+            ]
+            for endpoint, count in sorted(self.db_queries.items()):
+                lines.append(f'trivia_db_queries_total{_labels(endpoint=endpoint)} {count}')
+
+            lines += [
+                '# HELP trivia_db_query_seconds_total Time spent executing SQL statements, by endpoint.',
+                '# TYPE trivia_db_query_seconds_total counter',
+            ]
+            for endpoint, seconds in sorted(self.db_seconds.items()):
+                lines.append(f'trivia_db_query_seconds_total{_labels(endpoint=endpoint)} {seconds}')
+
+            lines += [
+                '# HELP trivia_admission_rejected_total Requests shed by admission control, by endpoint and reason.',
+                '# TYPE trivia_admission_rejected_total counter',
+            ]
+            for (endpoint, reason), count in sorted(self.rejections.items()):
+                lines.append(f'trivia_admission_rejected_total{_labels(endpoint=endpoint, reason=reason)} {count}')
+
+        caches = []
+        for name, extension in sorted((extensions or {}).items()):
+            stats = getattr(extension, 'stats', None)
+            if callable(stats):
+                caches.append((name, stats()))
+        for metric, key, kind, help_text in [
+            ('trivia_cache_hits_total', 'hits', 'counter', 'Cache hits, by cache.'),
+            ('trivia_cache_misses_total', 'misses', 'counter', 'Cache misses, by cache.'),
+            ('trivia_cache_entries', 'size', 'gauge', 'Entries held, by cache.'),
+        ]:
+            lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} {kind}']
+            for name, stats in caches:
+                if key in stats:
+                    lines.append(f'{metric}{_labels(cache=name)} {stats[key]}')
+
+        try:
+            pool = pool_status()
+        except Exception:
+            pool = {}
+        for key in ('size', 'checked_in', 'checked_out', 'overflow'):
+            if key in pool:
+                lines += [
+                    f'# HELP trivia_db_pool_{key} Connection pool {key.replace("_", " ")}.',
+                    f'# TYPE trivia_db_pool_{key} gauge',
+                    f'trivia_db_pool_{key} {pool[key]}',
+                ]
+
+        return '\n'.join(lines) + '\n'
+
+
+def init_app(app, metrics):
+    """Record every request of `app` in `metrics`."""
+
+    @app.before_request
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+        g.metrics_queries = 0
+        g.metrics_db_seconds = 0.0
+
+    @app.after_request
+    def record_request(response):
+        if 'metrics_started' not in g:
+            return response
+        seconds = time.perf_counter() - g.metrics_started
+        metrics.observe_request(
+            request.endpoint or 'unmatched',
+            request.method,
+            response.status_code,
+            seconds,
+            g.metrics_queries,
+            g.metrics_db_seconds
+        )
+        if app.config.get('SERVER_TIMING', False):
+            response.headers['Server-Timing'] = (
+                f'db;dur={g.metrics_db_seconds * 1000:.3f};desc="{g.metrics_queries} queries", '
+                f'app;dur={seconds * 1000:.3f}'
+            )
+        return response
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info['metrics_query_started'] = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _record_query(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop('metrics_query_started', None)
+    if started is not None and has_request_context() and 'metrics_started' in g:
+        g.metrics_queries += 1
+        g.metrics_db_seconds += time.perf_counter() - started
@@ -0,0 +1,156 @@
+import secrets
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+from itsdangerous import BadSignature, URLSafeSerializer
+from sqlalchemy import BigInteger, cast
+
+# A prime above every INTEGER id, so that x -> (a * x + b) mod SHUFFLE_MODULUS
+# is a bijection on the ids for any 0 < a < SHUFFLE_MODULUS
+SHUFFLE_MODULUS = 2 ** 31 - 1
+
+
+class QuizSessionStore:
+    """
+    Interface for quiz session storage.
+
+    A session is a pre-shuffled deck of question ids. Stores only need to
+    support handing out the next id atomically, so a shared backend can map
+    `draw` onto something like a list pop.
+    """
+
+    def create(self, deck):
+        """Store `deck` and return a new session id."""
+        raise NotImplementedError
+
+    def draw(self, session_id):
+        """
+        Pop the next question id from the session's deck.
+
+        Returns None once the deck is empty and raises KeyError when the
+        session does not exist or has expired.
+        """
+        raise NotImplementedError
+
+    def delete(self, session_id):
+        raise NotImplementedError
+
+
+class MemoryQuizSessionStore(QuizSessionStore):
+    """
+    Process-local store that keeps at most `max_sessions` sessions holding
+    at most `max_ids` question ids in total, evicting the least recently
+    used ones, and expires sessions idle for `ttl` seconds.
+
+    Decks are kept as arrays of 64-bit integers, 8 bytes per id.
+    """
+
+    def __init__(self, max_sessions=10000, ttl=3600, max_ids=2000000):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_ids = max_ids
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+        self._ids = 0
+
+    def create(self, deck):
+        session_id = secrets.token_urlsafe(16)
+        deck = array('q', deck)
+        with self._lock:
+            self._sessions[session_id] = [deck, time.monotonic() + self.ttl]
+            self._ids += len(deck)
+            # The new session is kept even if its deck alone is over max_ids
+            while len(self._sessions) > self.max_sessions \
+                    or self._ids > self.max_ids and len(self._sessions) > 1:
+                self._ids -= len(self._sessions.popitem(last=False)[1][0])
+        return session_id
+
+    def draw(self, session_id):
+        with self._lock:
+            session = self._sessions[session_id]
+            if session[1] < time.monotonic():
+                del self._sessions[session_id]
+                self._ids -= len(session[0])
+                raise KeyError(session_id)
+            self._sessions.move_to_end(session_id)
+            session[1] = time.monotonic() + self.ttl
+            deck = session[0]
+            if not deck:
+                return None
+            self._ids -= 1
+            return deck.pop()
+
+    def delete(self, session_id):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is not None:
+                self._ids -= len(session[0])
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._sessions), 'ids': self._ids}
+
+
+def _shuffle_params(seed):
+    return 1 + seed % (SHUFFLE_MODULUS - 1), (seed >> 32) % SHUFFLE_MODULUS
+
+
+def shuffle_key(question_id, seed):
+    """
+    Rank of `question_id` in the shuffled order given by `seed`.
+
+    This is an affine map modulo a prime, so no two ids share a rank, and
+    it is cheap enough for the database to compute it, see
+    shuffle_key_expression().
+    """
+    a, b = _shuffle_params(seed)
+    return (a * question_id + b) % SHUFFLE_MODULUS
+
+
+def shuffle_key_expression(column, seed):
+    """shuffle_key() of `column` as a SQL expression."""
+    a, b = _shuffle_params(seed)
+    # 64-bit arithmetic, since a * id overflows a 32-bit INTEGER
+    return (cast(column, BigInteger) * a + b) % SHUFFLE_MODULUS
+
+
+class QuizProgress:
+    """
+    Signed progress tokens for stateless quizzes.
+
+    A token holds the category, a random seed and the last question id
+    drawn. The next question is the remaining id with the lowest
+    `shuffle_key` above the last one, found by the database in one query.
+    The order is fixed by the seed alone, so questions added or deleted
+    mid-quiz never cause repeats.
+    """
+
+    def __init__(self, secret):
+        self._serializer = URLSafeSerializer(secret, salt='quiz-progress')
+
+    def start(self, category_id):
+        return [category_id, secrets.randbits(64), None]
+
+    def dumps(self, progress):
+        return self._serializer.dumps(progress)
+
+    def loads(self, token):
+        """Return the progress in `token`; raises ValueError when it was not signed here."""
+        try:
+            progress = self._serializer.loads(token)
+        except BadSignature as e:
+            raise ValueError('Invalid progress token') from e
+        return progress
+
+    @staticmethod
+    def next_row(query, id_column, seed, last_id=None):
+        """Return the row of `query` drawn after `last_id`, or None when none are left."""
+        key = shuffle_key_expression(id_column, seed)
+        if last_id is not None:
+            query = query.filter(key > shuffle_key(last_id, seed))
+        return query.order_by(key).first()
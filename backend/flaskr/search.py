@@ -0,0 +1,337 @@
+import bisect
+import re
+from collections import Counter
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, literal, literal_column, or_, select, text
+
+from models import Question, db
+from .cache import LazyIndex
+
+TOKEN_RE = re.compile(r'\w+')
+
+# Relative weight of a match in the answer; the same as ts_rank's default
+# for weight B against weight A
+ANSWER_WEIGHT = 0.4
+
+# Lowest trigram similarity between a search word and a question word for a
+# fuzzy match
+FUZZY_THRESHOLD = 0.4
+
+
+def tokenize(value):
+    return TOKEN_RE.findall((value or '').lower())
+
+
+def trigrams(word):
+    """The trigrams of `word` padded the way pg_trgm pads it."""
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchEngine:
+    """
+    Interface for question search backends.
+
+    `search` returns the requested page of questions, as rows from
+    Question.select_columns(fields) ranked by relevance, together with the total
+    number of matches. Every token of the term has to
+    match as a word prefix; an empty term matches every question.
+
+    `fuzzy_search` returns the same, but matches words that are spelled
+    similarly to the term's words. Results are ordered by trigram
+    similarity.
+    """
+
+    def search(self, term, page=1, per_page=10, include_answers=False, fields=None):
+        raise NotImplementedError
+
+    def fuzzy_search(self, term, page=1, per_page=10, include_answers=False, fields=None):
+        raise NotImplementedError
+
+    def ensure_schema(self):
+        pass
+
+    def warm_up(self):
+        pass
+
+    def invalidate(self):
+        pass
+
+
+class PostgresSearchEngine(SearchEngine):
+    """
+    Full-text search over a generated `tsvector` column with a GIN index.
+
+    Question text is indexed with weight A and answers with weight B, so
+    question-only searches restrict the query to A lexemes and results are
+    ordered by `ts_rank`.
+    """
+
+    def __init__(self, config='english', fuzzy_threshold=FUZZY_THRESHOLD):
+        self.config = config
+        self.fuzzy_threshold = fuzzy_threshold
+
+    def ensure_schema(self):
+        db.session.execute(text(
+            "ALTER TABLE questions ADD COLUMN IF NOT EXISTS search_vector tsvector "
+            "GENERATED ALWAYS AS ("
+            f"setweight(to_tsvector('{self.config}', coalesce(question, '')), 'A') || "
+            f"setweight(to_tsvector('{self.config}', coalesce(answer, '')), 'B')"
+            ") STORED"
+        ))
+        db.session.execute(text(
+            'CREATE INDEX IF NOT EXISTS ix_questions_search_vector '
+            'ON questions USING gin (search_vector)'
+        ))
+        db.session.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+        for column in ('question', 'answer'):
+            db.session.execute(text(
+                f'CREATE INDEX IF NOT EXISTS ix_questions_{column}_trgm '
+                f'ON questions USING gin ({column} gin_trgm_ops)'
+            ))
+        db.session.commit()
+
+    def search(self, term, page=1, per_page=10, include_answers=False, fields=None):
+        tokens = tokenize(term)
+        query = Question.select_columns(fields)
+        if not tokens:
+            order_by = [Question.id]
+        else:
+            weights = '' if include_answers else 'A'
+            tsquery = func.to_tsquery(
+                self.config, ' & '.join(f'{token}:*{weights}' for token in tokens)
+            )
+            search_vector = literal_column('questions.search_vector')
+            query = query.filter(search_vector.op('@@')(tsquery))
+            order_by = [func.ts_rank(search_vector, tsquery).desc(), Question.id]
+
+        total = query.order_by(None).count()
+        questions = query.order_by(*order_by) \
+            .offset((page - 1) * per_page).limit(per_page).all()
+        return questions, total
+
+    def fuzzy_search(self, term, page=1, per_page=10, include_answers=False, fields=None):
+        term = ' '.join(tokenize(term))
+        if not term:
+            return self.search(term, page=page, per_page=per_page, fields=fields)
+
+        # `<%` uses the GIN trigram indexes with this threshold
+        db.session.execute(select(func.set_config(
+            'pg_trgm.word_similarity_threshold', str(self.fuzzy_threshold), True
+        )))
+        term = literal(term)
+        match = term.op('<%')(Question.question)
+        similarity = func.word_similarity(term, Question.question)
+        if include_answers:
+            match = or_(match, term.op('<%')(Question.answer))
+            similarity = func.greatest(similarity, ANSWER_WEIGHT * func.word_similarity(term, Question.answer))
+
+        query = Question.select_columns(fields).filter(match)
+        total = query.count()
+        questions = query.order_by(similarity.desc(), Question.id) \
+            .offset((page - 1) * per_page).limit(per_page).all()
+        return questions, total
+
+
+class MemorySearchEngine(LazyIndex, SearchEngine):
+    """
+    Pure-Python inverted index for SQLite and test runs.
+
+    The index is built from the questions table on first use and then kept up
+    to date by the Question mapper events. Prefixes are resolved against a
+    sorted vocabulary with bisect. Fuzzy searches look up similar words of
+    the vocabulary through a trigram index, so their cost follows the size
+    of the vocabulary rather than the number of questions.
+    """
+
+    def __init__(self, fuzzy_threshold=FUZZY_THRESHOLD):
+        super().__init__()
+        self.fuzzy_threshold = fuzzy_threshold
+        self._clear()
+
+    def _read(self):
+        return db.session.query(Question.id, Question.question, Question.answer).all()
+
+    def _build(self, rows):
+        for question_id, question, answer in rows:
+            self._add(question_id, question, answer)
+
+    def _clear(self):
+        self._documents = {}
+        self._postings = {'question': {}, 'answer': {}}
+        self._vocabulary = []
+        self._trigrams = {}
+
+    def _add(self, question_id, question, answer):
+        document = {'question': Counter(tokenize(question)), 'answer': Counter(tokenize(answer))}
+        self._documents[question_id] = document
+        for field, counts in document.items():
+            postings = self._postings[field]
+            for token, count in counts.items():
+                if token not in postings:
+                    postings[token] = {}
+                    if not self._in_vocabulary(token):
+                        bisect.insort(self._vocabulary, token)
+                        for gram in trigrams(token):
+                            self._trigrams.setdefault(gram, set()).add(token)
+                postings[token][question_id] = count
+
+    def _remove(self, question_id):
+        document = self._documents.pop(question_id, None)
+        if document is None:
+            return
+        for field, counts in document.items():
+            postings = self._postings[field]
+            for token in counts:
+                postings[token].pop(question_id, None)
+                if not postings[token]:
+                    del postings[token]
+                    if not any(token in p for p in self._postings.values()):
+                        del self._vocabulary[bisect.bisect_left(self._vocabulary, token)]
+                        for gram in trigrams(token):
+                            self._trigrams[gram].discard(token)
+                            if not self._trigrams[gram]:
+                                del self._trigrams[gram]
+
+    def _in_vocabulary(self, token):
+        i = bisect.bisect_left(self._vocabulary, token)
+        return i < len(self._vocabulary) and self._vocabulary[i] == token
+
+    def _expand(self, prefix):
+        i = bisect.bisect_left(self._vocabulary, prefix)
+        while i < len(self._vocabulary) and self._vocabulary[i].startswith(prefix):
+            yield self._vocabulary[i]
+            i += 1
+
+    def _replace(self, question_id, question, answer):
+        self._remove(question_id)
+        self._add(question_id, question, answer)
+
+    def add(self, question):
+        self._write(self._replace, question.id, question.question, question.answer)
+
+    def remove(self, question_id, question=None):
+        self._write(self._remove, question_id)
+
+    def _similar(self, token):
+        """Return `{word: similarity}` for the vocabulary words similar to `token`."""
+        grams = trigrams(token)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._trigrams.get(gram, ()))
+        similar = {}
+        for word, count in shared.items():
+            similarity = count / (len(grams) + len(trigrams(word)) - count)
+            if similarity >= self.fuzzy_threshold:
+                similar[word] = similarity
+        return similar
+
+    def rank(self, term, include_answers=False):
+        """Return `(question_id, score)` pairs for `term`, best first."""
+        tokens = tokenize(term)
+        weights = {'question': 1.0}
+        if include_answers:
+            weights['answer'] = ANSWER_WEIGHT
+
+        with self._loaded():
+            if not tokens:
+                return [(question_id, 0) for question_id in sorted(self._documents)]
+
+            scores = None
+            for token in tokens:
+                token_scores = {}
+                for word in self._expand(token):
+                    for field, weight in weights.items():
+                        for question_id, count in self._postings[field].get(word, {}).items():
+                            token_scores[question_id] = token_scores.get(question_id, 0) + count * weight
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {
+                        question_id: score + token_scores[question_id]
+                        for question_id, score in scores.items() if question_id in token_scores
+                    }
+                if not scores:
+                    break
+
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+    def fuzzy_rank(self, term, include_answers=False):
+        """
+        Return `(question_id, similarity)` pairs for `term`, best first.
+
+        A question's similarity is the average over the term's words of the
+        best similarity of any word of the question, so questions that
+        match some of the words still qualify.
+        """
+        tokens = tokenize(term)
+        if not tokens:
+            return self.rank(term)
+        weights = {'question': 1.0}
+        if include_answers:
+            weights['answer'] = ANSWER_WEIGHT
+
+        scores = {}
+        with self._loaded():
+            for token in tokens:
+                token_scores = {}
+                for word, similarity in self._similar(token).items():
+                    for field, weight in weights.items():
+                        for question_id in self._postings[field].get(word, ()):
+                            score = similarity * weight
+                            if score > token_scores.get(question_id, 0):
+                                token_scores[question_id] = score
+                for question_id, score in token_scores.items():
+                    scores[question_id] = scores.get(question_id, 0) + score / len(tokens)
+
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+    def search(self, term, page=1, per_page=10, include_answers=False, fields=None):
+        return self._page(self.rank(term, include_answers=include_answers), page, per_page, fields)
+
+    def fuzzy_search(self, term, page=1, per_page=10, include_answers=False, fields=None):
+        return self._page(self.fuzzy_rank(term, include_answers=include_answers), page, per_page, fields)
+
+    def _page(self, ranked, page, per_page, fields=None):
+        start = (page - 1) * per_page
+        ids = [question_id for question_id, _ in ranked[start:start + per_page]]
+        if not ids:
+            return [], len(ranked)
+        rows = {row.id: row for row in Question.select_columns(fields).filter(Question.id.in_(ids))}
+        return [rows[question_id] for question_id in ids if question_id in rows], len(ranked)
+
+
+def create_search_engine(app):
+    backend = app.config.get('SEARCH_BACKEND')
+    if backend is None:
+        uri = app.config.get('SQLALCHEMY_DATABASE_URI', '')
+        backend = 'postgres' if uri.startswith('postgres') else 'memory'
+    fuzzy_threshold = app.config.get('SEARCH_FUZZY_THRESHOLD', FUZZY_THRESHOLD)
+    if backend == 'postgres':
+        return PostgresSearchEngine(app.config.get('SEARCH_TEXT_CONFIG', 'english'), fuzzy_threshold)
+    if backend == 'memory':
+        return MemorySearchEngine(fuzzy_threshold)
+    raise ValueError(f'Unknown SEARCH_BACKEND {backend!r}')
+
+
+def _memory_engine():
+    if not has_app_context():
+        return None
+    engine = current_app.extensions.get('search_engine')
+    return engine if isinstance(engine, MemorySearchEngine) else None
+
+
+@event.listens_for(Question, 'after_insert')
+@event.listens_for(Question, 'after_update')
+def _index_question(mapper, connection, target):
+    engine = _memory_engine()
+    if engine is not None:
+        engine.add(target)
+
+
+@event.listens_for(Question, 'after_delete')
+def _unindex_question(mapper, connection, target):
+    engine = _memory_engine()
+    if engine is not None:
+        engine.remove(target.id)
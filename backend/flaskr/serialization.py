@@ -0,0 +1,60 @@
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    JSON provider backed by orjson.
+
+    Keeps the stdlib provider's behaviour that matters to clients: sorted
+    keys, non-string keys such as category ids, compact output unless in
+    debug mode, and Flask's `default` for types orjson does not know.
+    Non-ASCII text is written as UTF-8 instead of \\u escapes.
+    """
+
+    def _options(self, indent=False):
+        options = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if indent:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps(self, obj, **kwargs):
+        # Callers asking for stdlib options (cls, separators, ...) get stdlib
+        if set(kwargs) - {'indent'}:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._options(bool(kwargs.get('indent')))).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        body = orjson.dumps(obj, default=self.default, option=self._options(indent) | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def create_json_provider(app, name=None):
+    """
+    Pick the JSON provider `name`, by default the JSON_PROVIDER setting:
+    `orjson`, `stdlib`, or `auto` (the default) for orjson when it is
+    installed.
+    """
+    name = name or app.config.get('JSON_PROVIDER', 'auto')
+    if name == 'auto':
+        name = 'orjson' if orjson is not None else 'stdlib'
+    if name == 'orjson':
+        if orjson is None:
+            raise RuntimeError('JSON_PROVIDER is orjson but orjson is not installed')
+        return OrjsonProvider(app)
+    if name == 'stdlib':
+        return DefaultJSONProvider(app)
+    raise ValueError(f'Unknown JSON_PROVIDER {name!r}')
@@ -0,0 +1,129 @@
+import bisect
+import heapq
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+
+from models import Question, db
+from .cache import LazyIndex
+from .search import tokenize
+
+MAX_WORD_LENGTH = 40
+
+
+class SuggestionIndex(LazyIndex):
+    """
+    Sorted array of the words of every question, with the number of
+    questions using each, for prefix completion.
+
+    It is built from the questions table on first use and then kept up to
+    date by the Question mapper events. At most `max_words` words are kept;
+    past that the rarest are dropped, so memory stays bounded however large
+    the catalog grows.
+    """
+
+    def __init__(self, max_words=50000):
+        super().__init__()
+        self.max_words = max_words
+        self._clear()
+
+    def _read(self):
+        counts = {}
+        for (text,) in db.session.query(Question.question).yield_per(1000):
+            for word in set(tokenize(text)):
+                if len(word) <= MAX_WORD_LENGTH:
+                    counts[word] = counts.get(word, 0) + 1
+        return counts
+
+    def _build(self, counts):
+        self._counts = counts
+        self._words = sorted(counts)
+        self._trim()
+
+    def _clear(self):
+        self._words = []
+        self._counts = {}
+
+    def _trim(self):
+        if len(self._counts) <= self.max_words:
+            return
+        # Leave some room so a full index is not re-sorted on every new word
+        keep = heapq.nlargest(int(self.max_words * 0.9), self._counts.items(), key=lambda item: item[1])
+        self._counts = dict(keep)
+        self._words = sorted(self._counts)
+
+    def _update(self, text, delta):
+        for word in set(tokenize(text)):
+            if len(word) > MAX_WORD_LENGTH:
+                continue
+            count = self._counts.get(word, 0) + delta
+            if count > 0:
+                if word not in self._counts:
+                    bisect.insort(self._words, word)
+                self._counts[word] = count
+            elif word in self._counts:
+                del self._counts[word]
+                del self._words[bisect.bisect_left(self._words, word)]
+        self._trim()
+
+    def add(self, text):
+        self._write(self._update, text, 1)
+
+    def discard(self, text):
+        self._write(self._update, text, -1)
+
+    def remove(self, question_id, question):
+        self.discard(question)
+
+    def suggest(self, prefix, limit=10):
+        """
+        Complete the last word of `prefix` with the most used words starting
+        with it, keeping the words before it.
+        """
+        tokens = tokenize(prefix)
+        if not tokens:
+            return []
+        head = ' '.join(tokens[:-1] + [''])
+        last = tokens[-1]
+        with self._loaded():
+            start = bisect.bisect_left(self._words, last)
+            end = bisect.bisect_left(self._words, last + '\uffff', start)
+            matches = heapq.nsmallest(
+                limit, self._words[start:end], key=lambda word: (-self._counts[word], word)
+            )
+        return [head + word for word in matches]
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._counts)}
+
+
+def _index():
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('suggestions')
+
+
+@event.listens_for(Question, 'after_insert')
+def _add_suggestions(mapper, connection, target):
+    index = _index()
+    if index is not None:
+        index.add(target.question)
+
+
+@event.listens_for(Question, 'after_update')
+def _update_suggestions(mapper, connection, target):
+    index = _index()
+    history = inspect(target).attrs.question.history
+    if index is not None and history.has_changes():
+        for text in history.deleted:
+            index.discard(text)
+        for text in history.added:
+            index.add(text)
+
+
+@event.listens_for(Question, 'after_delete')
+def _remove_suggestions(mapper, connection, target):
+    index = _index()
+    if index is not None:
+        index.discard(target.question)
@@ -0,0 +1,276 @@
+"""
+Concurrent quiz load replay for the trivia API.
+
+Simulates many players at once. Each player picks a category from the
+configured mix and POSTs /quizzes with its growing previous_questions list,
+pausing for the think time between turns, until the server returns
+`question: None` or the player has answered --max-turns questions. Every
+concurrency level is run against every catalog size and the report shows how
+throughput and turn latency scale:
+
+    python loadtest_quiz.py --sizes 10000,100000 --concurrency 1,8,32 --think-time 0.05
+
+By default the app runs in-process on a seeded SQLite file per size (see
+bench_flaskr.py). Pass --url to replay against a running server instead, e.g.
+gunicorn in front of Postgres; --workers process then spreads the players over
+processes so the client is not the bottleneck.
+
+While a level runs, a background thread samples the connection pool every
+--pool-interval seconds (in-process, or from /health/db with --url) and the
+report keeps the peak checked out and overflow connections. In-process
+players in --workers process each use their own pool, so nothing is sampled.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from bench_flaskr import make_vocabulary, seed, summarize
+
+_local = threading.local()
+_target = {}
+
+
+class HttpClient:
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+
+    def post(self, path, body=None):
+        request = urllib.request.Request(
+            self.url + path,
+            data=json.dumps(body or {}).encode('utf-8'),
+            headers={'Content-Type': 'application/json'},
+            method='POST'
+        )
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, json.load(response)
+        except urllib.error.HTTPError as e:
+            return e.code, _error_body(e)
+
+    def get(self, path):
+        try:
+            with urllib.request.urlopen(self.url + path) as response:
+                return response.status, json.load(response)
+        except urllib.error.HTTPError as e:
+            return e.code, _error_body(e)
+
+
+def _error_body(error):
+    # Error responses are JSON too, e.g. /health/db still reports the pool with a 503
+    try:
+        return json.load(error)
+    except ValueError:
+        return None
+
+
+class AppClient:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def post(self, path, body=None):
+        res = self.client.post(path, json=body or {})
+        return res.status_code, res.get_json()
+
+    def get(self, path):
+        res = self.client.get(path)
+        return res.status_code, res.get_json()
+
+
+def _init_target(url, database):
+    """Set up what the players in this process talk to."""
+    _target.clear()
+    _local.__dict__.pop('client', None)
+    if url:
+        _target['url'] = url
+    else:
+        from flaskr import create_app
+        _target['app'] = create_app({'SQLALCHEMY_DATABASE_URI': database, 'TESTING': True, 'ADMISSION_ENABLED': False})
+
+
+def _client():
+    # One client per thread; the Flask test client is not shared between threads
+    if not hasattr(_local, 'client'):
+        _local.client = HttpClient(_target['url']) if 'url' in _target else AppClient(_target['app'])
+    return _local.client
+
+
+def _pool_status():
+    """Return the pool counters of the target, or None when they cannot be read."""
+    if 'url' in _target:
+        _, data = _client().get('/health/db')
+        return (data or {}).get('pool')
+    from models import pool_status
+    with _target['app'].app_context():
+        return pool_status()
+
+
+class PoolSampler(threading.Thread):
+    """Samples the pool counters until stopped and keeps their peaks."""
+
+    def __init__(self, interval):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = {}
+        self.samples = 0
+        self.failed = 0
+        self._done = threading.Event()
+
+    def run(self):
+        while True:
+            self.sample()
+            if self._done.wait(self.interval):
+                break
+
+    def sample(self):
+        try:
+            status = _pool_status()
+        except OSError:
+            status = None
+        if status is None:
+            self.failed += 1
+            return
+        self.samples += 1
+        for name in ('checked_out', 'overflow'):
+            if name in status:
+                self.peak[name] = max(self.peak.get(name, status[name]), status[name])
+
+    def stop(self):
+        """Take a last sample and return the peaks."""
+        self._done.set()
+        self.join()
+        self.sample()
+        return {
+            'peak_checked_out': self.peak.get('checked_out'),
+            'peak_overflow': self.peak.get('overflow'),
+            'samples': self.samples,
+            'failed_samples': self.failed
+        }
+
+
+def play(player):
+    """Play one quiz and return the latency and status of every turn."""
+    rng = random.Random(player['seed'])
+    client = _client()
+    previous, turns = [], []
+    for turn in range(player['max_turns']):
+        if turn and player['think_time']:
+            time.sleep(rng.expovariate(1 / player['think_time']))
+        started = time.perf_counter()
+        status, data = client.post('/quizzes', {
+            'previous_questions': previous,
+            'quiz_category': {'id': player['category'], 'type': ''}
+        })
+        turns.append((time.perf_counter() - started, status))
+        if status != 200 or not data['question']:
+            break
+        previous.append(data['question']['id'])
+    return turns
+
+
+def parse_mix(value):
+    """Parse `0:0.5,1:0.25,3:0.25` into category ids and weights."""
+    mix = [item.split(':') for item in value.split(',')]
+    return [int(category) for category, _ in mix], [float(weight) for _, weight in mix]
+
+
+def run_level(executor, concurrency, players, mix, args, rng):
+    categories, weights = mix
+    plays = [
+        {
+            'seed': rng.random(),
+            'category': rng.choices(categories, weights)[0],
+            'max_turns': args.max_turns,
+            'think_time': args.think_time
+        }
+        for _ in range(players)
+    ]
+    started = time.perf_counter()
+    turns = [turn for result in executor.map(play, plays) for turn in result]
+    elapsed = time.perf_counter() - started
+
+    report = summarize([latency for latency, _ in turns], sum(1 for _, status in turns if status != 200), elapsed)
+    report['concurrency'] = concurrency
+    report['players'] = players
+    report['games_per_second'] = round(players / elapsed, 1)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10000,100000', help='catalog sizes to seed (default: %(default)s)')
+    parser.add_argument('--database', default=None,
+                        help='database URI to seed; defaults to sqlite:///bench_<size>.db per size')
+    parser.add_argument('--url', default=None,
+                        help='replay against a running server at this URL instead of an in-process app; '
+                             'the catalog is not seeded and --sizes only labels the report')
+    parser.add_argument('--concurrency', default='1,4,16,64', help='concurrent players per run (default: %(default)s)')
+    parser.add_argument('--players', type=int, default=None,
+                        help='players per run (default: 10 per concurrent player)')
+    parser.add_argument('--categories', default='0:1,1:1,2:1,3:1,4:1,5:1,6:1',
+                        help='category id:weight mix, 0 is "All" (default: %(default)s)')
+    parser.add_argument('--max-turns', type=int, default=5, help='questions per game (default: %(default)s)')
+    parser.add_argument('--think-time', type=float, default=0.0,
+                        help='mean seconds between turns, exponentially distributed')
+    parser.add_argument('--workers', choices=['thread', 'process'], default='thread')
+    parser.add_argument('--pool-interval', type=float, default=0.05,
+                        help='seconds between pool samples (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default=None, help='also write the JSON report to this file')
+    args = parser.parse_args(argv)
+
+    mix = parse_mix(args.categories)
+    levels = [int(level) for level in args.concurrency.split(',')]
+    results = {}
+
+    for size in [int(size) for size in args.sizes.split(',')]:
+        rng = random.Random(args.seed)
+        database = args.database or f'sqlite:///{os.path.abspath(f"bench_{size}.db")}'
+        if not args.url:
+            from flaskr import create_app
+            seed(create_app({'SQLALCHEMY_DATABASE_URI': database}), size, rng, make_vocabulary(rng))
+
+        # Threads share this process's app; processes each build their own
+        _init_target(args.url, database)
+        results[str(size)] = []
+        for concurrency in levels:
+            if args.workers == 'thread':
+                executor = ThreadPoolExecutor(concurrency)
+            else:
+                executor = ProcessPoolExecutor(concurrency, initializer=_init_target, initargs=(args.url, database))
+            sampler = PoolSampler(args.pool_interval) if args.url or args.workers == 'thread' else None
+            if sampler:
+                sampler.start()
+            try:
+                with executor:
+                    report = run_level(executor, concurrency, args.players or concurrency * 10, mix, args, rng)
+            finally:
+                pool = sampler.stop() if sampler else None
+            report['pool'] = pool
+            results[str(size)].append(report)
+            print(f'{size:>8} x{concurrency:<4} {report}', file=sys.stderr)
+
+    report = {
+        'meta': {
+            'target': args.url or args.database or 'sqlite',
+            'workers': args.workers,
+            'categories': args.categories,
+            'max_turns': args.max_turns,
+            'think_time': args.think_time,
+        },
+        'results': results
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+--
+-- Turn questions.category into an indexed integer foreign key.
+--
+-- Databases loaded from trivia.psql already have the integer column and the
+-- foreign key and only need the indexes. Databases created from the old
+-- String model have a text column that is converted first.
+--
+
+BEGIN;
+
+DO $$
+BEGIN
+    IF (SELECT data_type FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name = 'questions' AND column_name = 'category') <> 'integer' THEN
+        ALTER TABLE public.questions
+            ALTER COLUMN category TYPE integer USING NULLIF(trim(category), '')::integer;
+    END IF;
+
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint
+                   WHERE conrelid = 'public.questions'::regclass AND contype = 'f') THEN
+        -- Orphaned ids would make the constraint fail to validate
+        UPDATE public.questions SET category = NULL
+            WHERE category NOT IN (SELECT id FROM public.categories);
+        ALTER TABLE ONLY public.questions
+            ADD CONSTRAINT category FOREIGN KEY (category) REFERENCES public.categories(id) ON UPDATE CASCADE ON DELETE SET NULL;
+    END IF;
+END
+$$;
+
+CREATE INDEX IF NOT EXISTS ix_questions_category ON public.questions USING btree (category);
+CREATE INDEX IF NOT EXISTS ix_questions_category_difficulty ON public.questions USING btree (category, difficulty);
+
+COMMIT;
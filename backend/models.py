@@ -1,6 +1,11 @@
+import itertools
 import os
+from flask import current_app, g, has_request_context
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import Column, Integer, String, ForeignKey
+from flask_sqlalchemy.session import Session
+from sqlalchemy import Column, DateTime, Integer, String, ForeignKey, Index, delete, event, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import StaticPool
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -15,30 +20,186 @@ database_name = os.getenv('DB_NAME', 'trivia')
 
 database_path = f'postgresql://{database_user}:{database_password}@{database_host}:{database_port}/{database_name}'
 
-db = SQLAlchemy()
+REPLICA_BIND_PREFIX = 'replica_'
+REPLICA_STRATEGIES = ('round_robin', 'least_connections')
+
+"""
+RoutingSession
+    sends SELECTs to a read replica while the request allows it
+    (g.db_use_replica, set for read-only endpoints); any other statement or
+    flush goes to the primary and keeps the rest of the request there, so
+    reads made after a write see it
+"""
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_request_context() and g.get('db_use_replica'):
+            if self._flushing or not getattr(clause, 'is_select', False):
+                g.db_use_replica = False
+            else:
+                # One replica per request, so its reads are consistent
+                if 'db_replica' not in g:
+                    g.db_replica = current_app.extensions['db_replicas'].choose(self._db.engines)
+                return self._db.engines[g.db_replica]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+"""
+ReplicaRouter(bind_keys, strategy)
+    picks the replica bind for a request, in turn (round_robin) or the one
+    with the fewest checked out connections (least_connections)
+"""
+class ReplicaRouter:
+    def __init__(self, bind_keys, strategy='round_robin'):
+        if strategy not in REPLICA_STRATEGIES:
+            raise ValueError(f'Unknown DB_REPLICA_STRATEGY {strategy!r}')
+        self.bind_keys = list(bind_keys)
+        self.strategy = strategy
+        self._turn = itertools.count()
+
+    def __bool__(self):
+        return bool(self.bind_keys)
+
+    def choose(self, engines):
+        if self.strategy == 'least_connections':
+            return min(self.bind_keys, key=lambda key: _checked_out(engines[key]))
+        return self.bind_keys[next(self._turn) % len(self.bind_keys)]
+
+
+def _checked_out(engine):
+    checkedout = getattr(engine.pool, 'checkedout', None)
+    return checkedout() if callable(checkedout) else 0
+
+"""
+engine_options(database_path, config)
+    builds the SQLAlchemy engine options from the DB_* settings, read from
+    config (e.g. test_config) first and the environment second
+"""
+def engine_options(database_path, config=None):
+    config = config or {}
+
+    def setting(name, default, cast=int):
+        value = config.get(name, os.getenv(name))
+        if value is None or value == '':
+            return default
+        if cast is bool and isinstance(value, str):
+            return value.lower() in ('1', 'true', 'yes', 'on')
+        return cast(value)
+
+    # Check connections on checkout so workers recover after a failover
+    options = {'pool_pre_ping': setting('DB_POOL_PRE_PING', True, bool)}
+    url = make_url(database_path)
+
+    if is_memory_sqlite(url):
+        # Every connection to :memory: is a new empty database, so share one
+        options.update({
+            'poolclass': StaticPool,
+            'connect_args': {'check_same_thread': False},
+        })
+    elif url.get_backend_name() == 'postgresql':
+        options.update({
+            'pool_size': setting('DB_POOL_SIZE', 10),
+            'max_overflow': setting('DB_MAX_OVERFLOW', 20),
+            'pool_timeout': setting('DB_POOL_TIMEOUT', 10),
+            'pool_recycle': setting('DB_POOL_RECYCLE', 1800),
+            'pool_use_lifo': setting('DB_POOL_USE_LIFO', True, bool),
+        })
+        connect_args = {
+            'connect_timeout': setting('DB_CONNECT_TIMEOUT', 5),
+            'application_name': setting('DB_APPLICATION_NAME', 'trivia', str),
+        }
+        statement_timeout = setting('DB_STATEMENT_TIMEOUT', 0)
+        if statement_timeout:
+            connect_args['options'] = f'-c statement_timeout={statement_timeout}'
+        options['connect_args'] = connect_args
+
+    options.update(config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    return options
+
+"""
+is_memory_sqlite(url)
+    tells whether a database URL points at an in-memory SQLite database
+"""
+def is_memory_sqlite(url):
+    url = make_url(url)
+    return url.get_backend_name() == 'sqlite' and (
+        url.database in (None, '', ':memory:') or url.query.get('mode') == 'memory'
+    )
+
+"""
+use_sqlite_transactions(engine)
+    lets SQLAlchemy emit BEGIN itself instead of pysqlite, which is needed
+    for SAVEPOINT (and so for rolled-back test transactions) to work
+"""
+def use_sqlite_transactions(engine):
+    @event.listens_for(engine, 'connect')
+    def disable_pysqlite_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def begin(connection):
+        connection.exec_driver_sql('BEGIN')
+
+"""
+replica_paths(config)
+    reads the read replica URIs from DB_REPLICA_URLS, a list or a comma
+    separated string, in config first and the environment second
+"""
+def replica_paths(config):
+    value = config.get('DB_REPLICA_URLS', os.getenv('DB_REPLICA_URLS'))
+    if isinstance(value, str):
+        value = value.split(',')
+    return [path.strip() for path in value or [] if path.strip()]
 
 """
 setup_db(app)
-    binds a flask application and a SQLAlchemy service
+    binds a flask application and a SQLAlchemy service, without touching
+    the database; the schema is created by `flask init-db`. Read replicas
+    are registered as the binds replica_0, replica_1, ...
 """
-def setup_db(app, database_path=database_path):
+def setup_db(app, database_path=database_path, replicas=None):
+    if replicas is None:
+        replicas = replica_paths(app.config)
+    # SQLALCHEMY_ENGINE_OPTIONS from the config is meant for the primary only
+    replica_config = {k: v for k, v in app.config.items() if k != 'SQLALCHEMY_ENGINE_OPTIONS'}
+    binds = {
+        f'{REPLICA_BIND_PREFIX}{i}': {'url': path, **engine_options(path, replica_config)}
+        for i, path in enumerate(replicas)
+    }
+
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(database_path, app.config)
+    app.config["SQLALCHEMY_BINDS"] = {**app.config.get("SQLALCHEMY_BINDS", {}), **binds}
+    app.extensions['db_replicas'] = ReplicaRouter(
+        binds, app.config.get('DB_REPLICA_STRATEGY', os.getenv('DB_REPLICA_STRATEGY', 'round_robin'))
+    )
     db.app = app
     db.init_app(app)
     with app.app_context():
-        db.create_all()
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                use_sqlite_transactions(engine)
 
 """
 Question
 """
 class Question(db.Model):
     __tablename__ = 'questions'
+    # The keys of format(), which clients can pick from with ?fields=
+    FIELDS = ('id', 'question', 'answer', 'category', 'difficulty')
+    __table_args__ = (
+        Index('ix_questions_category_difficulty', 'category', 'difficulty'),
+    )
 
     id = Column(Integer, primary_key=True)
     question = Column(String)
     answer = Column(String)
-    category = Column(String)
+    category = Column(
+        Integer,
+        ForeignKey('categories.id', name='category', onupdate='CASCADE', ondelete='SET NULL'),
+        index=True
+    )
     difficulty = Column(Integer)
 
     def __init__(self, question, answer, category, difficulty):
@@ -58,15 +219,77 @@ class Question(db.Model):
         db.session.delete(self)
         db.session.commit()
 
+    """
+    delete_where(*criteria)
+        deletes every matching question with a single DELETE statement in one
+        transaction and returns the (id, question) rows that were actually
+        deleted, so in-memory indexes can forget them
+    """
+    @classmethod
+    def delete_where(cls, *criteria):
+        if db.session.get_bind().dialect.delete_returning:
+            statement = delete(cls).where(*criteria).returning(cls.id, cls.question)
+            deleted = db.session.execute(statement).all()
+        else:
+            deleted = db.session.execute(select(cls.id, cls.question).where(*criteria)).all()
+            if deleted:
+                db.session.execute(delete(cls).where(cls.id.in_([row.id for row in deleted])))
+        db.session.commit()
+        return deleted
+
     def format(self):
+        return Question.format_row(self)
+
+    """
+    select_columns(fields=None)
+        queries the formatted columns, or only `fields` plus the id, as plain
+        tuples, without building ORM objects, for the list endpoints
+    """
+    @classmethod
+    def select_columns(cls, fields=None):
+        if fields is None:
+            return db.session.query(cls.id, cls.question, cls.answer, cls.category, cls.difficulty)
+        # Callers match rows up by id, so it is always selected
+        return db.session.query(cls.id, *[getattr(cls, field) for field in fields if field != 'id'])
+
+    """
+    format_row(row, fields=None)
+        formats a Question or a row from select_columns(), keeping only
+        `fields` when given
+    """
+    @staticmethod
+    def format_row(row, fields=None):
+        if fields is not None:
+            return {
+                field: Question.format_row_category(row) if field == 'category' else getattr(row, field)
+                for field in fields
+            }
         return {
-            'id': self.id,
-            'question': self.question,
-            'answer': self.answer,
-            'category': self.category,
-            'difficulty': self.difficulty
+            'id': row.id,
+            'question': row.question,
+            'answer': row.answer,
+            'category': Question.format_row_category(row),
+            'difficulty': row.difficulty
         }
 
+    @staticmethod
+    def format_row_category(row):
+        # Still emitted as a string while clients move to the integer id
+        return str(row.category) if row.category is not None else None
+
+"""
+pool_status()
+    reports the connection pool counters of the bound engine
+"""
+def pool_status():
+    pool = db.engine.pool
+    status = {'class': type(pool).__name__}
+    for name, attr in [('size', 'size'), ('checked_in', 'checkedin'),
+                       ('checked_out', 'checkedout'), ('overflow', 'overflow')]:
+        if hasattr(pool, attr):
+            status[name] = getattr(pool, attr)()
+    return status
+
 """
 Category
 """
@@ -84,3 +307,13 @@ class Category(db.Model):
             'id': self.id,
             'type': self.type
         }
+
+"""
+SchemaMigration
+    a file from migrations/ that has been applied to this database
+"""
+class SchemaMigration(db.Model):
+    __tablename__ = 'schema_migrations'
+
+    version = Column(String, primary_key=True)
+    applied_at = Column(DateTime)
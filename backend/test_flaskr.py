@@ -1,13 +1,30 @@
+import csv
+import gzip
+import io
 import os
+import tempfile
+import time
 import unittest
+from contextlib import contextmanager
 import json
+import sqlite3
+from flask import g
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import text
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import scoped_session, sessionmaker
 from werkzeug.exceptions import HTTPException
 from dotenv import load_dotenv
 
-from flaskr import create_app
-from models import setup_db, Question, Category, db
+from flaskr import create_app, warm_up
+from flaskr.admission import ConcurrencyLimiter, MemoryRateLimitBackend
+from flaskr.bulk import iter_json_array
+from flaskr.cache import normalize_term
+from flaskr.cli import create_schema
+from flaskr.quiz import MemoryQuizSessionStore, QuizProgress
+from flaskr.serialization import create_json_provider
+from models import setup_db, engine_options, is_memory_sqlite, ReplicaRouter, Question, Category, db
 
 # Load environment variables
 load_dotenv()
@@ -15,28 +32,28 @@ load_dotenv()
 class TriviaTestCase(unittest.TestCase):
     """This class represents the trivia test case"""
 
-    def setUp(self):
-        """Define test variables and initialize app."""
-        self.database_name = os.getenv('DB_TEST_NAME', 'trivia_test')
-        self.database_user = os.getenv('DB_USER', 'postgres')
-        self.database_password = os.getenv('DB_PASSWORD', '')
-        self.database_host = os.getenv('DB_HOST', 'localhost')
-        self.database_port = os.getenv('DB_PORT', '5432')
-        
-        self.database_path = f"postgresql://{self.database_user}:{self.database_password}@{self.database_host}:{self.database_port}/{self.database_name}"
-        
-        # Create app with test configuration
-        self.app = create_app({
-            "SQLALCHEMY_DATABASE_URI": self.database_path,
+    @classmethod
+    def setUpClass(cls):
+        """Create the schema and the seed rows once for the whole class."""
+        # In-memory SQLite unless a test database is configured, e.g.
+        # TEST_DATABASE_URL=postgresql://postgres@localhost:5432/trivia_test
+        cls.database_path = os.getenv('TEST_DATABASE_URL') or 'sqlite://'
+        cls.config = {
+            "SQLALCHEMY_DATABASE_URI": cls.database_path,
             "SQLALCHEMY_TRACK_MODIFICATIONS": False,
             "TESTING": True
-        })
-        self.client = self.app.test_client
+        }
+        cls.memory = is_memory_sqlite(cls.database_path)
+        if cls.memory:
+            # Every app built by setUp has its own engine; point them all at
+            # the same in-memory database
+            cls.sqlite_connection = sqlite3.connect(':memory:', check_same_thread=False)
+            cls.config["SQLALCHEMY_ENGINE_OPTIONS"] = {'creator': lambda: cls.sqlite_connection}
+
+        app = create_app(cls.config)
+        with app.app_context():
+            create_schema(drop=True)
 
-        # Bind the app to the current context and create all tables
-        with self.app.app_context():
-            db.create_all()
-            
             # Add test categories
             categories = [
                 Category(type='Science'),
@@ -54,19 +71,19 @@ class TriviaTestCase(unittest.TestCase):
                 Question(
                     question='What is the capital of France?',
                     answer='Paris',
-                    category='3',  # Geography
+                    category=3,  # Geography
                     difficulty=1
                 ),
                 Question(
                     question='Who painted the Mona Lisa?',
                     answer='Leonardo da Vinci',
-                    category='2',  # Art
+                    category=2,  # Art
                     difficulty=2
                 ),
                 Question(
                     question='What is the largest planet in our solar system?',
                     answer='Jupiter',
-                    category='1',  # Science
+                    category=1,  # Science
                     difficulty=3
                 )
             ]
@@ -74,6 +91,31 @@ class TriviaTestCase(unittest.TestCase):
                 db.session.add(question)
             
             db.session.commit()
+        cls.class_app = app
+
+    @classmethod
+    def tearDownClass(cls):
+        with cls.class_app.app_context():
+            db.session.remove()
+            db.drop_all(bind_key=None)
+            db.engine.dispose()
+        if cls.memory:
+            cls.sqlite_connection.close()
+
+    def setUp(self):
+        """Initialize a fresh app and open a transaction rolled back after the test."""
+        self.app = create_app(self.config)
+        self.client = self.app.test_client
+
+        with self.app.app_context():
+            self.connection = db.engine.connect()
+        self.transaction = self.connection.begin()
+
+        # Commits inside the app only release a savepoint of this transaction
+        self.session = db.session
+        db.session = scoped_session(sessionmaker(
+            bind=self.connection, join_transaction_mode='create_savepoint'
+        ))
 
         # Sample question for use in tests
         self.new_question = {
@@ -85,11 +127,34 @@ class TriviaTestCase(unittest.TestCase):
 
     def tearDown(self):
         """Executed after each test"""
+        db.session.remove()
+        db.session = self.session
+        self.transaction.rollback()
+        self.connection.close()
+        if not self.memory:
+            with self.app.app_context():
+                db.engine.dispose()
+
+    def drop_table(self, name):
+        """Drop a table inside the test transaction to simulate a database error."""
         with self.app.app_context():
-            db.session.execute(text('DROP TABLE IF EXISTS questions CASCADE'))
-            db.session.execute(text('DROP TABLE IF EXISTS categories CASCADE'))
+            cascade = ' CASCADE' if db.engine.dialect.name == 'postgresql' else ''
+            db.session.execute(text(f'DROP TABLE IF EXISTS {name}{cascade}'))
             db.session.commit()
-            db.session.close()
+
+    @contextmanager
+    def rejecting_inserts(self, marker):
+        """Make the database reject question inserts with `marker` in their values."""
+        def reject(conn, cursor, statement, parameters, context, executemany):
+            rows = parameters if executemany else [parameters]
+            if statement.startswith('INSERT INTO questions') and any(marker in str(row) for row in rows):
+                raise IntegrityError(statement, parameters, Exception('rejected'))
+
+        event.listen(Engine, 'before_cursor_execute', reject)
+        try:
+            yield
+        finally:
+            event.remove(Engine, 'before_cursor_execute', reject)
 
     def test_get_categories(self):
         """Test GET /categories endpoint"""
@@ -100,6 +165,24 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertTrue(data['categories'])
 
+    def test_categories_served_from_registry(self):
+        """Test categories are loaded once and invalidated on write"""
+        registry = self.app.extensions['category_registry']
+        self.client().get('/categories')
+        self.client().get('/questions')
+        self.client().get('/categories/1/questions')
+        self.assertEqual(registry.misses, 1)
+        self.assertEqual(registry.hits, 2)
+
+        with self.app.app_context():
+            db.session.add(Category(type='Music'))
+            db.session.commit()
+
+        res = self.client().get('/categories')
+        data = json.loads(res.data)
+        self.assertIn('Music', data['categories'].values())
+        self.assertEqual(registry.misses, 2)
+
     def test_get_questions(self):
         """Test GET /questions endpoint"""
         res = self.client().get('/questions')
@@ -121,6 +204,68 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['message'], 'Resource not found')
 
+    def test_get_questions_after_id(self):
+        """Test GET /questions with a keyset cursor"""
+        res = self.client().get('/questions')
+        first_id = json.loads(res.data)['questions'][0]['id']
+
+        res = self.client().get(f'/questions?after_id={first_id}')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(all(q['id'] > first_id for q in data['questions']))
+        self.assertEqual(data['total_questions'], 3)
+
+    def test_total_questions_updates_after_create(self):
+        """Test the cached question count is dropped when a question is added"""
+        res = self.client().get('/questions')
+        total = json.loads(res.data)['total_questions']
+
+        self.client().post('/questions', json=self.new_question)
+        res = self.client().get('/questions')
+        data = json.loads(res.data)
+
+        self.assertEqual(data['total_questions'], total + 1)
+
+    def test_conditional_get(self):
+        """Test GET endpoints answer 304 until the data changes"""
+        for path in ['/categories', '/questions?page=1', '/categories/1/questions']:
+            res = self.client().get(path)
+            etag = res.headers['ETag']
+            self.assertEqual(res.status_code, 200)
+
+            res = self.client().get(path, headers={'If-None-Match': etag})
+            self.assertEqual(res.status_code, 304)
+            self.assertEqual(res.headers['ETag'], etag)
+            self.assertEqual(res.data, b'')
+
+        res = self.client().get('/questions')
+        etag = res.headers['ETag']
+        self.assertNotEqual(etag, self.client().get('/questions?page=1').headers['ETag'])
+
+        self.client().post('/questions', json=self.new_question)
+        res = self.client().get('/questions', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+
+    def test_conditional_get_if_modified_since(self):
+        """Test GET endpoints honour If-Modified-Since"""
+        data_version = self.app.extensions['data_version']
+        data_version._modified = time.time() - 2
+        res = self.client().get('/categories')
+        last_modified = res.headers['Last-Modified']
+
+        res = self.client().get('/categories', headers={'If-Modified-Since': last_modified})
+        self.assertEqual(res.status_code, 304)
+
+        # A write in the same second as the response it validates is not missed
+        data_version.invalidate()
+        res = self.client().get('/categories', headers={'If-Modified-Since': last_modified})
+        self.assertEqual(res.status_code, 200)
+        res = self.client().get('/categories', headers={'If-Modified-Since': res.headers['Last-Modified']})
+        self.assertEqual(res.status_code, 200)
+
     def test_delete_question(self):
         """Test DELETE /questions/<id> endpoint"""
         # First create a question to delete
@@ -145,6 +290,47 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['message'], 'Unprocessable entity')
 
+    def test_delete_questions_by_ids(self):
+        """Test DELETE /questions with a list of ids"""
+        res = self.client().post('/questions/search', json={'searchTerm': 'capital'})
+        self.assertEqual(json.loads(res.data)['total_questions'], 1)
+
+        res = self.client().delete('/questions', json={'ids': [1, 2, 1000]})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['deleted'], [1, 2])
+        self.assertEqual(data['total_deleted'], 2)
+
+        res = self.client().get('/questions')
+        data = json.loads(res.data)
+        self.assertEqual(data['total_questions'], 1)
+        self.assertEqual([q['id'] for q in data['questions']], [3])
+
+        res = self.client().post('/questions/search', json={'searchTerm': 'capital'})
+        self.assertEqual(json.loads(res.data)['total_questions'], 0)
+
+    def test_delete_questions_by_filter(self):
+        """Test DELETE /questions with a category and difficulty filter"""
+        res = self.client().delete('/questions', json={'category': 2, 'difficulty': 2})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['deleted'], [2])
+
+        res = self.client().get('/categories/2/questions')
+        self.assertEqual(json.loads(res.data)['total_questions'], 0)
+
+    def test_400_if_batch_delete_has_no_criteria(self):
+        """Test DELETE /questions refuses to delete without criteria"""
+        for body in [{}, {'ids': 'all'}, {'ids': [True]}, {'unknown': 1}, {'category': 'x'}, {'difficulty': True}]:
+            res = self.client().delete('/questions', json=body)
+            self.assertEqual(res.status_code, 400)
+
+        res = self.client().get('/questions')
+        self.assertEqual(json.loads(res.data)['total_questions'], 3)
+
     def test_create_question(self):
         """Test POST /questions endpoint for creating new question"""
         res = self.client().post('/questions', json=self.new_question)
@@ -154,6 +340,25 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertTrue(data['created'])
 
+    def test_create_question_with_string_category(self):
+        """Test POST /questions still accepts the category id as a string"""
+        res = self.client().post('/questions', json=dict(self.new_question, category='3'))
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+
+        res = self.client().get('/categories/3/questions')
+        data = json.loads(res.data)
+        self.assertEqual(data['total_questions'], 2)
+        self.assertTrue(all(q['category'] == '3' for q in data['questions']))
+
+    def test_422_if_question_category_does_not_exist(self):
+        """Test POST /questions rejects unknown categories"""
+        res = self.client().post('/questions', json=dict(self.new_question, category=999))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['success'], False)
+
     def test_400_if_question_creation_fails(self):
         """Test error handling for invalid question creation"""
         res = self.client().post('/questions', json={})
@@ -163,6 +368,132 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['message'], 'Bad request')
 
+    def test_bulk_create_questions(self):
+        """Test POST /questions/bulk with a JSON array"""
+        rows = [self.new_question, {'question': 'Missing answer'}, dict(self.new_question, category=999)]
+        res = self.client().post('/questions/bulk?batch_size=1', json=rows)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['inserted'], 1)
+        self.assertEqual(data['failed'], 2)
+        self.assertEqual([(e['index'], e['error']) for e in data['errors']], [(1, 400), (2, 422)])
+
+        res = self.client().get('/questions')
+        self.assertEqual(json.loads(res.data)['total_questions'], 4)
+
+    def test_bulk_create_questions_reports_only_failing_rows(self):
+        """Test a batch rejected by the database is retried row by row"""
+        rows = [self.new_question] * 2 + [dict(self.new_question, question='Rejected?')] + [self.new_question] * 2
+        with self.rejecting_inserts('Rejected'):
+            res = self.client().post('/questions/bulk', json=rows)
+        data = json.loads(res.data)
+
+        self.assertEqual(data['inserted'], 4)
+        self.assertEqual([(e['index'], e['error']) for e in data['errors']], [(2, 422)])
+
+    def test_bulk_create_questions_validates_types(self):
+        """Test POST /questions/bulk rejects rows with values of the wrong type"""
+        rows = [
+            dict(self.new_question, question={'x': 1}),
+            dict(self.new_question, answer=5),
+            dict(self.new_question, difficulty=True),
+            dict(self.new_question, difficulty=2 ** 70),
+            dict(self.new_question, difficulty='2')
+        ]
+        res = self.client().post('/questions/bulk', data=json.dumps(rows), content_type='application/json')
+        data = json.loads(res.data)
+
+        self.assertEqual(data['inserted'], 1)
+        self.assertEqual([e['index'] for e in data['errors']], [0, 1, 2, 3])
+
+    def test_bulk_create_questions_invalid_utf8(self):
+        """Test invalid UTF-8 mid-upload ends it with an error at that row"""
+        body = b'[' + json.dumps(self.new_question).encode() + b', {"question": "\xff"}]'
+        res = self.client().post('/questions/bulk', data=body, content_type='application/json')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['inserted'], 1)
+        self.assertEqual([(e['index'], e['error']) for e in data['errors']], [(1, 400)])
+
+    def test_bulk_create_questions_ndjson(self):
+        """Test POST /questions/bulk with a streamed NDJSON body"""
+        body = '\n'.join([json.dumps(self.new_question)] * 3 + ['not json', ''])
+        res = self.client().post('/questions/bulk', data=body,
+                                 content_type='application/x-ndjson')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['inserted'], 3)
+        self.assertEqual(data['errors'], [{'index': 3, 'error': 400, 'message': 'Bad request'}])
+
+    def test_400_if_bulk_body_is_not_an_array(self):
+        """Test POST /questions/bulk rejects bodies that are not arrays"""
+        res = self.client().post('/questions/bulk', json=self.new_question)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+
+    def test_iter_json_array_across_chunks(self):
+        """Test the incremental JSON array reader with tiny chunks"""
+        rows = [{'question': 'Qu\u00e9?', 'n': 12345}, [1, 2], 678]
+        stream = io.BytesIO(json.dumps(rows).encode('utf-8'))
+        self.assertEqual(list(iter_json_array(stream, chunk_size=3)), rows)
+
+        numbers = [1.25, -3e-05, 7]
+        stream = io.BytesIO(json.dumps(numbers).encode('utf-8'))
+        self.assertEqual(list(iter_json_array(stream, chunk_size=1)), numbers)
+
+        items = list(iter_json_array(io.BytesIO(b'[{"a": 1} {"b": 2}]')))
+        self.assertEqual(items[0], {'a': 1})
+        self.assertIsInstance(items[1], ValueError)
+
+    def test_iter_json_array_stops_at_bad_item(self):
+        """Test a malformed or oversized item ends the upload without reading the rest"""
+        stream = io.BytesIO(b'[{"a": tru}, ' + b'{"b": 2}, ' * 10000 + b'{}]')
+        items = list(iter_json_array(stream, chunk_size=64))
+        self.assertEqual(len(items), 1)
+        self.assertIsInstance(items[0], ValueError)
+        self.assertLess(stream.tell(), 1000)
+
+        stream = io.BytesIO(b'["' + b'x' * 10000 + b'"]')
+        items = list(iter_json_array(stream, chunk_size=64, max_item_size=1000))
+        self.assertEqual(len(items), 1)
+        self.assertIsInstance(items[0], ValueError)
+        self.assertLess(stream.tell(), 2000)
+
+    def test_export_questions(self):
+        """Test GET /questions/export streams NDJSON and CSV"""
+        res = self.client().get('/questions/export')
+        rows = [json.loads(line) for line in res.data.decode().splitlines()]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]['question'], 'What is the capital of France?')
+
+        res = self.client().get('/questions/export?format=csv&category=2&difficulty=2')
+        rows = list(csv.DictReader(io.StringIO(res.data.decode())))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['answer'], 'Leonardo da Vinci')
+
+    def test_export_questions_failure(self):
+        """Test GET /questions/export error handling"""
+        res = self.client().get('/questions/export?format=xml')
+        self.assertEqual(res.status_code, 400)
+
+        for query in ('category=abc', 'difficulty=hard', 'category='):
+            res = self.client().get(f'/questions/export?{query}')
+            self.assertEqual(res.status_code, 400)
+
+        res = self.client().get('/questions/export?category=999')
+        self.assertEqual(res.status_code, 404)
+
     def test_search_questions(self):
         """Test POST /questions/search endpoint"""
         res = self.client().post('/questions/search', 
@@ -175,6 +506,65 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['total_questions'])
         self.assertEqual(data['current_category'], None)
 
+    def test_search_questions_non_string_term(self):
+        """Test POST /questions/search searches for a number as text"""
+        res = self.client().post('/questions/search', json={'searchTerm': 5})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['total_questions'], 0)
+
+    def test_search_index_invalidated_during_lookup(self):
+        """Test a search index invalidated right after loading is loaded again"""
+        engine = self.app.extensions['search_engine']
+        load = engine._ensure_loaded
+        invalidated = []
+
+        def load_then_invalidate():
+            load()
+            if not invalidated:
+                invalidated.append(True)
+                engine.invalidate()
+
+        engine._ensure_loaded = load_then_invalidate
+        res = self.client().post('/questions/search', json={'searchTerm': ''})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(json.loads(res.data)['total_questions'], 3)
+        self.assertEqual(invalidated, [True])
+
+    def test_search_questions_include_answers(self):
+        """Test POST /questions/search matching answers when asked to"""
+        res = self.client().post('/questions/search', json={'searchTerm': 'jupiter'})
+        data = json.loads(res.data)
+        self.assertEqual(data['total_questions'], 0)
+
+        res = self.client().post('/questions/search',
+                               json={'searchTerm': 'jupiter', 'include_answers': True})
+        data = json.loads(res.data)
+        self.assertEqual(data['total_questions'], 1)
+        self.assertEqual(data['questions'][0]['answer'], 'Jupiter')
+
+    def test_search_questions_paginated(self):
+        """Test POST /questions/search pages ranked results"""
+        self.client().post('/questions', json=self.new_question)
+
+        res = self.client().post('/questions/search',
+                               json={'searchTerm': 'capit', 'page': 1})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['total_questions'], 2)
+        self.assertEqual(len(data['questions']), 2)
+
+        res = self.client().post('/questions/search',
+                               json={'searchTerm': 'capit', 'page': 2})
+        data = json.loads(res.data)
+        self.assertEqual(data['total_questions'], 2)
+        self.assertEqual(data['questions'], [])
+
+        res = self.client().post('/questions/search',
+                               json={'searchTerm': 'capit', 'page': 0})
+        self.assertEqual(res.status_code, 400)
+
     def test_get_questions_by_category(self):
         """Test GET /categories/<id>/questions endpoint"""
         res = self.client().get('/categories/1/questions')
@@ -186,6 +576,81 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['total_questions'])
         self.assertEqual(data['current_category'], 1)
 
+    def test_batch(self):
+        """Test POST /batch runs each sub-request and returns every response"""
+        res = self.client().post('/batch', json=[
+            {'method': 'GET', 'path': '/categories'},
+            {'path': '/questions?page=1&fields=id'},
+            {'method': 'POST', 'path': '/questions', 'body': self.new_question},
+            {'method': 'POST', 'path': '/questions/search', 'body': {'searchTerm': 'spain'}},
+            {'path': '/categories/1000/questions'}
+        ])
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        statuses = [response['status'] for response in data['responses']]
+        self.assertEqual(statuses, [200, 200, 200, 200, 404])
+        responses = [response['body'] for response in data['responses']]
+        self.assertEqual(len(responses[0]['categories']), 6)
+        self.assertEqual(responses[1]['questions'][0], {'id': 1})
+        self.assertEqual(responses[3]['questions'][0]['id'], responses[2]['created'])
+        self.assertEqual(responses[4]['message'], 'Resource not found')
+        self.assertNotIn('ETag', res.headers)
+
+    def test_batch_continues_after_failed_write(self):
+        """Test a sub-request failing mid-transaction does not break the ones after it"""
+        with self.rejecting_inserts('Rejected'):
+            res = self.client().post('/batch', json=[
+                {'method': 'POST', 'path': '/questions', 'body': {**self.new_question, 'question': 'Rejected?'}},
+                {'path': '/questions'},
+                {'method': 'POST', 'path': '/quizzes/sessions', 'body': {'quiz_category': {'id': 0}}}
+            ])
+        statuses = [response['status'] for response in json.loads(res.data)['responses']]
+        self.assertEqual(statuses, [422, 200, 200])
+
+    def test_batch_failure(self):
+        """Test POST /batch rejects invalid or oversized batches"""
+        bodies = [
+            {'path': '/categories'},
+            [],
+            [{'path': '/categories'}] * 21,
+            [{'method': 'PATCH', 'path': '/categories'}],
+            [{'path': 'categories'}],
+            [{'path': '/batch'}]
+        ]
+        for body in bodies:
+            res = self.client().post('/batch', json=body)
+            self.assertEqual(res.status_code, 400)
+
+    def test_sparse_fieldsets(self):
+        """Test ?fields= and ?include= on the question list endpoints"""
+        res = self.client().get('/questions?fields=id,question,category')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(set(data['questions'][0]), {'id', 'question', 'category'})
+        self.assertIsInstance(data['questions'][0]['category'], str)
+        self.assertIn('categories', data)
+
+        res = self.client().get('/questions?fields=question&include=')
+        data = json.loads(res.data)
+        self.assertEqual(set(data['questions'][0]), {'question'})
+        self.assertNotIn('categories', data)
+
+        res = self.client().get('/categories/1/questions?fields=answer&include=categories')
+        data = json.loads(res.data)
+        self.assertEqual(data['questions'], [{'answer': 'Jupiter'}])
+        self.assertEqual(data['categories']['1'], 'Science')
+
+        res = self.client().post('/questions/search?fields=id', json={'searchTerm': 'capital'})
+        data = json.loads(res.data)
+        self.assertEqual(data['questions'], [{'id': 1}])
+        self.assertNotIn('categories', data)
+
+        for url in ['/questions?fields=secret', '/questions?fields=', '/categories/1/questions?include=tags']:
+            res = self.client().get(url)
+            self.assertEqual(res.status_code, 400)
+
     def test_404_if_category_does_not_exist(self):
         """Test error handling for non-existent category"""
         res = self.client().get('/categories/1000/questions')
@@ -301,12 +766,468 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['message'], 'Unprocessable entity')
 
+    def test_quiz_session(self):
+        """Test drawing every question from a quiz session deck"""
+        res = self.client().post('/quizzes/sessions',
+                               json={'quiz_category': {'id': 0, 'type': 'All'}})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['total_questions'], 3)
+        session_id = data['session_id']
+
+        seen = []
+        for _ in range(3):
+            res = self.client().post(f'/quizzes/sessions/{session_id}/next')
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 200)
+            self.assertTrue(data['question'])
+            seen.append(data['question']['id'])
+        self.assertEqual(len(set(seen)), 3)
+
+        res = self.client().post(f'/quizzes/sessions/{session_id}/next')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertIsNone(data['question'])
+
+    def test_quiz_session_with_specific_category(self):
+        """Test a quiz session only deals questions from its category"""
+        res = self.client().post('/quizzes/sessions',
+                               json={'quiz_category': {'id': 3, 'type': 'Geography'}})
+        session_id = json.loads(res.data)['session_id']
+
+        res = self.client().post(f'/quizzes/sessions/{session_id}/next')
+        data = json.loads(res.data)
+        self.assertEqual(data['question']['category'], '3')
+
+    def test_quiz_session_failure(self):
+        """Test quiz session error handling"""
+        res = self.client().post('/quizzes/sessions',
+                               json={'quiz_category': {'id': 999, 'type': 'Invalid'}})
+        self.assertEqual(res.status_code, 422)
+
+        res = self.client().post('/quizzes/sessions/unknown/next')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['message'], 'Resource not found')
+
+    def test_quiz_session_store_bounds_ids(self):
+        """Test quiz sessions are evicted once their decks hold too many ids"""
+        store = MemoryQuizSessionStore(max_sessions=10, max_ids=5)
+        first = store.create([1, 2, 3])
+        second = store.create([4, 5, 6])
+        self.assertEqual(store.stats(), {'size': 1, 'ids': 3})
+        with self.assertRaises(KeyError):
+            store.draw(first)
+        self.assertEqual(store.draw(second), 6)
+        self.assertEqual(store.stats()['ids'], 2)
+        store.delete(second)
+        self.assertEqual(store.stats(), {'size': 0, 'ids': 0})
+
+        self.app.config['QUIZ_DECK_SIZE'] = 2
+        res = self.client().post('/quizzes/sessions', json={'quiz_category': {'id': 0, 'type': 'click'}})
+        self.assertEqual(json.loads(res.data)['total_questions'], 2)
+
+    def test_database_health(self):
+        """Test GET /health/db reports the connection pool"""
+        res = self.client().get('/health/db')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['database'], 'ok')
+        self.assertIn('class', data['pool'])
+
+    def test_engine_options(self):
+        """Test pool settings come from the config before the environment"""
+        options = engine_options('postgresql://localhost/trivia', {
+            'DB_POOL_SIZE': '3',
+            'DB_POOL_PRE_PING': 'false',
+            'DB_STATEMENT_TIMEOUT': 5000,
+            'SQLALCHEMY_ENGINE_OPTIONS': {'max_overflow': 0}
+        })
+        self.assertEqual(options['pool_size'], 3)
+        self.assertEqual(options['max_overflow'], 0)
+        self.assertFalse(options['pool_pre_ping'])
+        self.assertEqual(options['connect_args']['options'], '-c statement_timeout=5000')
+
+        options = engine_options('sqlite://', {})
+        self.assertNotIn('pool_size', options)
+
+    def test_metrics(self):
+        """Test GET /metrics exposes request, query and cache metrics"""
+        self.client().get('/questions')
+        self.client().get('/categories')
+        res = self.client().get('/metrics')
+        body = res.data.decode()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.content_type.startswith('text/plain'))
+        self.assertIn('trivia_http_requests_total{endpoint="get_questions",method="GET",status="200"} 1', body)
+        self.assertIn('trivia_http_request_duration_seconds_count{endpoint="get_questions"} 1', body)
+        self.assertIn('trivia_db_queries_total{endpoint="get_questions"}', body)
+        self.assertIn('trivia_db_queries_total{endpoint="get_categories"} 0', body)
+        self.assertIn('trivia_cache_hits_total{cache="category_registry"} 1', body)
+
+    def test_server_timing_header(self):
+        """Test the optional Server-Timing header"""
+        res = self.client().get('/questions')
+        self.assertNotIn('Server-Timing', res.headers)
+
+        self.app.config['SERVER_TIMING'] = True
+        res = self.client().get('/questions')
+        self.assertIn('db;dur=', res.headers['Server-Timing'])
+
+    def test_response_compression(self):
+        """Test responses are gzipped when accepted and large enough"""
+        compressor = self.app.extensions['compression']
+        compressor.min_size = 0
+
+        plain = self.client().get('/questions')
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertIn('Accept-Encoding', plain.headers['Vary'])
+
+        for _ in range(2):
+            res = self.client().get('/questions', headers={'Accept-Encoding': 'gzip'})
+            self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+            self.assertEqual(gzip.decompress(res.data), plain.data)
+        # The second response reused the bytes cached under its ETag
+        self.assertEqual(compressor.stats()['hits'], 1)
+
+        res = self.client().get('/questions', headers={'Accept-Encoding': 'gzip;q=0'})
+        self.assertNotIn('Content-Encoding', res.headers)
+
+        compressor.min_size = len(plain.data) + 1
+        res = self.client().get('/questions', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', res.headers)
+
+    def test_create_app_does_no_database_io(self):
+        """Test building the app runs no SQL until a request or warm_up needs it"""
+        statements = []
+        record = lambda *args: statements.append(args[2])
+        event.listen(Engine, 'before_cursor_execute', record)
+        try:
+            app = create_app(self.config)
+            self.assertEqual(statements, [])
+
+            warm_up(app)
+            self.assertTrue(statements)
+            self.assertEqual(app.extensions['category_registry'].misses, 1)
+        finally:
+            event.remove(Engine, 'before_cursor_execute', record)
+
+    def test_init_db_command(self):
+        """Test flask init-db creates the schema and loads trivia.psql once"""
+        with tempfile.TemporaryDirectory() as directory:
+            app = create_app({
+                'SQLALCHEMY_DATABASE_URI': f'sqlite:///{directory}/trivia.db',
+                'TESTING': True
+            })
+            # Use the app's own session rather than the test transaction
+            test_session, db.session = db.session, self.session
+            try:
+                runner = app.test_cli_runner()
+                result = runner.invoke(args=['init-db'])
+                self.assertEqual(result.exit_code, 0, result.output)
+                self.assertIn('Loaded 6 categories, 19 questions.', result.output)
+
+                result = runner.invoke(args=['init-db'])
+                self.assertIn('skipped the seed data', result.output)
+
+                result = runner.invoke(args=['migrate-db'])
+                self.assertIn('nothing to do on sqlite', result.output)
+
+                with app.app_context():
+                    self.assertEqual(Question.query.count(), 19)
+                    question = db.session.get(Question, 16)
+                    self.assertEqual(question.answer, 'Escher')
+                    self.assertEqual(question.category, 2)
+                    db.engine.dispose()
+            finally:
+                db.session = test_session
+
+    def test_read_replica_routing(self):
+        """Test read endpoints use the replica and writes stay on the primary"""
+        with tempfile.TemporaryDirectory() as directory:
+            paths = [f'sqlite:///{directory}/{name}.db' for name in ('primary', 'replica')]
+            for path, name in zip(paths, ('Primary', 'Replica')):
+                engine = create_engine(path)
+                db.metadata.create_all(engine)
+                with engine.begin() as connection:
+                    connection.execute(Category.__table__.insert(), [{'type': name}])
+                engine.dispose()
+
+            app = create_app({
+                'SQLALCHEMY_DATABASE_URI': paths[0],
+                'DB_REPLICA_URLS': paths[1],
+                'TESTING': True
+            })
+            test_session, db.session = db.session, self.session
+            try:
+                client = app.test_client()
+                res = client.get('/categories')
+                self.assertEqual(json.loads(res.data)['categories'], {'1': 'Replica'})
+
+                res = client.post('/questions', json={**self.new_question, 'category': 1})
+                self.assertEqual(res.status_code, 200)
+                with app.app_context():
+                    self.assertEqual(Question.query.count(), 1)
+
+                # Reads after a write in the same request go to the primary
+                with app.test_request_context('/questions'):
+                    g.db_use_replica = True
+                    self.assertEqual(db.session.query(Category.type).scalar(), 'Replica')
+                    db.session.add(Category(type='Music'))
+                    db.session.flush()
+                    types = [name for name, in db.session.query(Category.type).order_by(Category.id)]
+                    self.assertEqual(types, ['Primary', 'Music'])
+                    db.session.rollback()
+
+                # Batched reads after a batched write go to the primary too
+                res = client.post('/batch', json=[
+                    {'method': 'POST', 'path': '/questions', 'body': {**self.new_question, 'category': 1}},
+                    {'path': '/categories/1/questions'}
+                ])
+                responses = json.loads(res.data)['responses']
+                self.assertEqual(responses[1]['body']['total_questions'], 2)
+
+                with app.app_context():
+                    for engine in db.engines.values():
+                        engine.dispose()
+            finally:
+                db.session = test_session
+
+    def test_replica_router(self):
+        """Test replicas are chosen in turn"""
+        router = ReplicaRouter(['replica_0', 'replica_1'])
+        self.assertEqual([router.choose({}) for _ in range(3)], ['replica_0', 'replica_1', 'replica_0'])
+        self.assertFalse(ReplicaRouter([]))
+        with self.assertRaises(ValueError):
+            ReplicaRouter(['replica_0'], strategy='random')
+
+    def test_quiz_progress_token(self):
+        """Test a quiz played with a progress token visits every question once"""
+        res = self.client().post('/quizzes', json={'progress': True, 'quiz_category': {'id': 0}})
+        data = json.loads(res.data)
+        seen = [data['question']['id']]
+
+        while True:
+            res = self.client().post('/quizzes', json={'progress_token': data['progress_token']})
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 200)
+            if data['question'] is None:
+                break
+            seen.append(data['question']['id'])
+
+        self.assertEqual(sorted(seen), [1, 2, 3])
+
+    def test_quiz_progress_token_failure(self):
+        """Test tampered tokens and unknown categories are rejected"""
+        res = self.client().post('/quizzes', json={'progress': True, 'quiz_category': {'id': 3}})
+        self.assertEqual(json.loads(res.data)['question']['id'], 1)
+
+        forged = QuizProgress('another secret').dumps([3, 1, None])
+        res = self.client().post('/quizzes', json={'progress_token': forged})
+        self.assertEqual(res.status_code, 422)
+
+        res = self.client().post('/quizzes', json={'progress': True, 'quiz_category': {'id': 1000}})
+        self.assertEqual(res.status_code, 422)
+
+    def test_quiz_progress_order_survives_deletes(self):
+        """Test the shuffled order is fixed by the seed, so deletes cause no repeats"""
+        with self.app.app_context():
+            for i in range(10):
+                Question(f'Question {i}?', 'Answer', 1, 1).insert()
+            ids = sorted(question_id for (question_id,) in db.session.query(Question.id).filter(Question.category == 1))
+        progress = self.app.extensions['quiz_progress']
+        seed = 0x9E3779B97F4A7C15
+
+        def draw(last_id):
+            res = self.client().post('/quizzes', json={'progress_token': progress.dumps([1, seed, last_id])})
+            question = json.loads(res.data)['question']
+            return question['id'] if question else None
+
+        order = []
+        while True:
+            last_id = draw(order[-1] if order else None)
+            if last_id is None:
+                break
+            order.append(last_id)
+        self.assertEqual(sorted(order), ids)
+        self.assertNotEqual(order, ids)
+
+        self.client().delete(f'/questions/{order[5]}')
+        self.assertEqual(draw(order[4]), order[6])
+
+    def test_fuzzy_search(self):
+        """Test fuzzy search tolerates misspelled words"""
+        res = self.client().post('/questions/search', json={'searchTerm': 'capitl'})
+        self.assertEqual(json.loads(res.data)['total_questions'], 0)
+
+        res = self.client().post('/questions/search', json={'searchTerm': 'capitl of frnace', 'fuzzy': True})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['questions'][0]['id'], 1)
+
+        res = self.client().post('/questions/search', json={'searchTerm': 'largst', 'fuzzy': True})
+        self.assertEqual([q['id'] for q in json.loads(res.data)['questions']], [3])
+
+        res = self.client().post('/questions/search', json={'searchTerm': 'leonrdo', 'fuzzy': True})
+        self.assertEqual(json.loads(res.data)['total_questions'], 0)
+        res = self.client().post('/questions/search', json={
+            'searchTerm': 'leonrdo', 'fuzzy': True, 'include_answers': True
+        })
+        self.assertEqual([q['id'] for q in json.loads(res.data)['questions']], [2])
+
+    def test_suggest_questions(self):
+        """Test GET /questions/suggest completes the last word from question text"""
+        res = self.client().get('/questions/suggest?prefix=Ca')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['suggestions'], ['capital'])
+
+        res = self.client().get('/questions/suggest?prefix=the%20la')
+        self.assertEqual(json.loads(res.data)['suggestions'], ['the largest'])
+
+        # 'what' is used by two questions, so it comes before 'who'
+        res = self.client().get('/questions/suggest?prefix=w&limit=2')
+        self.assertEqual(json.loads(res.data)['suggestions'], ['what', 'who'])
+
+    def test_suggestions_follow_writes(self):
+        """Test the suggestion index is updated on insert and delete"""
+        self.client().get('/questions/suggest?prefix=ma')
+        res = self.client().post('/questions', json={**self.new_question, 'question': 'Where is Madrid?'})
+        question_id = json.loads(res.data)['created']
+
+        res = self.client().get('/questions/suggest?prefix=ma')
+        self.assertEqual(json.loads(res.data)['suggestions'], ['madrid'])
+
+        # Deletes drop the question's words without emptying the index
+        self.client().delete(f'/questions/{question_id}')
+        self.assertTrue(self.app.extensions['suggestions'].stats()['size'])
+        res = self.client().get('/questions/suggest?prefix=ma')
+        self.assertEqual(json.loads(res.data)['suggestions'], [])
+
+        self.client().delete('/questions', json={'ids': [2]})
+        res = self.client().get('/questions/suggest?prefix=mo')
+        self.assertEqual(json.loads(res.data)['suggestions'], [])
+
+    def test_suggestions_invalidated_during_lookup(self):
+        """Test a suggestion index invalidated right after loading is loaded again"""
+        suggestions = self.app.extensions['suggestions']
+        load = suggestions._ensure_loaded
+        invalidated = []
+
+        def load_then_invalidate():
+            load()
+            if not invalidated:
+                invalidated.append(True)
+                suggestions.invalidate()
+
+        suggestions._ensure_loaded = load_then_invalidate
+        res = self.client().get('/questions/suggest?prefix=ca')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(json.loads(res.data)['suggestions'], ['capital'])
+        self.assertEqual(invalidated, [True])
+
+    def test_suggest_questions_failure(self):
+        """Test GET /questions/suggest without a prefix or with a bad limit"""
+        self.assertEqual(self.client().get('/questions/suggest').status_code, 400)
+        self.assertEqual(self.client().get('/questions/suggest?prefix=a&limit=0').status_code, 400)
+
+    def test_search_result_cache(self):
+        """Test search pages are cached by normalized term and dropped on insert"""
+        cache = self.app.extensions['search_results']
+        res = self.client().post('/questions/search', json={'searchTerm': 'capital'})
+        self.assertEqual(json.loads(res.data)['total_questions'], 1)
+
+        res = self.client().post('/questions/search', json={'searchTerm': '  CAPITAL '})
+        self.assertEqual(json.loads(res.data)['total_questions'], 1)
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['hit_rate'], 0.5)
+
+        self.client().post('/questions', json=self.new_question)
+        res = self.client().post('/questions/search', json={'searchTerm': 'capital'})
+        self.assertEqual(json.loads(res.data)['total_questions'], 2)
+        self.assertEqual(cache.stats()['misses'], 2)
+
+        body = self.client().get('/metrics').data.decode()
+        self.assertIn('trivia_cache_hits_total{cache="search_results"} 1', body)
+        self.assertIn('trivia_cache_entries{cache="search_results"} 1', body)
+
+        # Terms the engines tokenize differently never share an entry
+        self.assertNotEqual(normalize_term('Stra\u00dfe'), normalize_term('STRASSE'))
+
+    def test_rate_limit(self):
+        """Test clients over their token bucket get 429 with Retry-After"""
+        controller = self.app.extensions['admission']
+        controller.rate, controller.burst = 0.5, 2
+        search = {'searchTerm': 'capital'}
+
+        for _ in range(2):
+            self.assertEqual(self.client().post('/questions/search', json=search).status_code, 200)
+        res = self.client().post('/questions/search', json=search)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 429)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'Too many requests')
+        self.assertEqual(res.headers['Retry-After'], '2')
+        # Other endpoints are not limited
+        self.assertEqual(self.client().get('/questions').status_code, 200)
+
+        body = self.client().get('/metrics').data.decode()
+        self.assertIn('trivia_admission_rejected_total{endpoint="search_questions",reason="rate_limit"} 1', body)
+
+    def test_concurrency_limit(self):
+        """Test requests beyond the concurrency limit are shed once the queue is full"""
+        controller = self.app.extensions['admission']
+        controller.limiter = ConcurrencyLimiter(1, max_queue=0)
+        quiz = {'previous_questions': [], 'quiz_category': {'id': 0}}
+
+        self.assertTrue(controller.limiter.acquire())
+        res = self.client().post('/quizzes', json=quiz)
+        self.assertEqual(res.status_code, 429)
+        self.assertEqual(res.headers['Retry-After'], '1')
+
+        controller.limiter.release()
+        self.assertEqual(self.client().post('/quizzes', json=quiz).status_code, 200)
+        # The slot taken by that request was given back
+        self.assertTrue(controller.limiter.acquire())
+        controller.limiter.release()
+
+    def test_memory_rate_limit_backend(self):
+        """Test token buckets refill over time"""
+        now = [0.0]
+        backend = MemoryRateLimitBackend(max_keys=1, clock=lambda: now[0])
+        self.assertEqual([backend.take('a', 1, 2) for _ in range(2)], [0, 0])
+        self.assertEqual(backend.take('a', 1, 2), 1)
+        now[0] = 1.0
+        self.assertEqual(backend.take('a', 1, 2), 0)
+        # Only the most recent client is remembered
+        backend.take('b', 1, 2)
+        self.assertEqual(backend.take('a', 1, 2), 0)
+
+    def test_json_providers_match(self):
+        """Test the orjson and stdlib JSON providers return the same documents"""
+        bodies = {}
+        for provider in ('orjson', 'stdlib'):
+            self.app.json = create_json_provider(self.app, provider)
+            bodies[provider] = [
+                self.client().get('/questions').get_json(),
+                self.client().get('/categories/3/questions').get_json(),
+                self.client().post('/questions/search', json={'searchTerm': 'capital'}).get_json()
+            ]
+
+        self.assertEqual(bodies['orjson'], bodies['stdlib'])
+        self.assertEqual(bodies['orjson'][0]['categories']['3'], 'Geography')
+        self.assertEqual(bodies['orjson'][1]['questions'][0]['category'], '3')
+
     def test_get_categories_failure(self):
         """Test GET /categories endpoint failure"""
         # Simulate database error by dropping the categories table
-        with self.app.app_context():
-            db.session.execute(text('DROP TABLE IF EXISTS categories CASCADE'))
-            db.session.commit()
+        self.drop_table('categories')
         
         res = self.client().get('/categories')
         data = json.loads(res.data)
@@ -318,9 +1239,7 @@ class TriviaTestCase(unittest.TestCase):
     def test_get_questions_failure(self):
         """Test GET /questions endpoint failure"""
         # Simulate database error by dropping the questions table
-        with self.app.app_context():
-            db.session.execute(text('DROP TABLE IF EXISTS questions CASCADE'))
-            db.session.commit()
+        self.drop_table('questions')
         
         res = self.client().get('/questions')
         data = json.loads(res.data)
@@ -13,6 +13,7 @@ class QuestionView extends Component {
       totalQuestions: 0,
       categories: {},
       currentCategory: null,
+      searchTerm: null,
     };
   }
 
@@ -30,6 +31,7 @@ class QuestionView extends Component {
           totalQuestions: result.total_questions,
           categories: result.categories,
           currentCategory: result.current_category,
+          searchTerm: null,
         });
         return;
       },
@@ -41,6 +43,11 @@ class QuestionView extends Component {
   };
 
   selectPage(num) {
+    // Search results are paged by the search endpoint itself
+    if (this.state.searchTerm !== null) {
+      this.submitSearch(this.state.searchTerm, num);
+      return;
+    }
     this.setState({ page: num }, () => this.getQuestions());
   }
 
@@ -72,6 +79,7 @@ class QuestionView extends Component {
           questions: result.questions,
           totalQuestions: result.total_questions,
           currentCategory: result.current_category,
+          searchTerm: null,
         });
         return;
       },
@@ -82,13 +90,13 @@ class QuestionView extends Component {
     });
   };
 
-  submitSearch = (searchTerm) => {
+  submitSearch = (searchTerm, page = 1) => {
     $.ajax({
       url: `/questions/search`, // Updated to use the correct search endpoint
       type: 'POST',
       dataType: 'json',
       contentType: 'application/json',
-      data: JSON.stringify({ searchTerm: searchTerm }),
+      data: JSON.stringify({ searchTerm: searchTerm, page: page }),
       xhrFields: {
         withCredentials: true,
       },
@@ -98,6 +106,8 @@ class QuestionView extends Component {
           questions: result.questions,
           totalQuestions: result.total_questions,
           currentCategory: result.current_category,
+          searchTerm: searchTerm,
+          page: page,
         });
         return;
       },